@@ -1,11 +1,14 @@
 import os
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
+import atexit
+import base64
 import json
+import threading
 import numpy as np
 from PIL import Image
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from auth.firebase_auth import create_user, verify_user, get_user_by_uid_and_get_details, login_user, get_user_by_uid, update_user_email, update_user_password, update_user_display_name, refresh_id_token
-from models.userModel import save_user_to_firestore, get_user_by_uid, get_user_profile, save_user_photo, update_user_location, add_created_thread_to_user
+from models.userModel import save_user_to_firestore, get_user_by_uid, get_user_profile, save_user_photo, update_user_location, add_created_thread_to_user, mark_profile_photo_pending, save_profile_photo_derivatives, invalidate_cached_user, USER_CACHE
 from models.threadmodel import (
     save_thread_to_firestore,
     get_thread_by_id,
@@ -14,39 +17,98 @@ from models.threadmodel import (
     save_upvote_to_firestore,
     check_if_user_upvoted,
     get_upvotes_by_thread_id,
-    get_all_threads,
-    remove_upvote_from_firestore
+    get_threads_page,
+    remove_upvote_from_firestore,
+    mark_thread_photo_pending,
+    set_thread_photo_derivatives
 )
 from firebase_admin import firestore
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from google.cloud import storage
-from utils.tflite_model import load_tflite_model_from_gcs, run_tflite_inference, load_class_names
-from utils.image_preprocess import preprocess_image
-from models.wilayah_lookup import load_all_regions, suggest_regions_by_name, get_codes_by_name, find_name_by_code
+from utils.gcs_uploads import UploadQueue, upload_stream, public_url
+from utils.image_derivatives import DerivativePipeline
+from utils.image_validation import ImageValidator, ImageRejected
+from utils.tflite_model import get_model_registry, model_name_for_plant, load_class_names, batch_capacity
+from utils.image_preprocess import preprocess_for_spec
+from utils.batching import BatchScheduler
+from utils.result_cache import ResultCache, content_key
+from utils.inference_workers import InferenceWorkerPool
+from utils.admission import AdmissionController, Overloaded
+from models.wilayah_lookup import region_level
+from models.region_store import load_region_index
+from models.region_search import RegionSearch
 import requests
 import uuid
+import zipfile
 
 app = Flask(__name__)
-app.config["UPLOAD_FOLDER"] = "./uploads"
+# Bodies over this size are refused with 413 before any part of them is parsed
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 64 * 1024 * 1024))
 GCS_BUCKET_NAME = "tanicare-threads"
 
 # Utility functions for Google Cloud Storage
-def get_gcs_client():
-    return storage.Client.from_service_account_json("bucket.json")
-
-def upload_to_bucket(bucket_name, source_file_path, destination_blob_name):
-    client = get_gcs_client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
+def upload_to_bucket(bucket_name, source, destination_blob_name, content_type=None):
+    """Upload a file path or file object as a public object and return its public URL."""
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return upload_stream(bucket_name, destination_blob_name, f, content_type)
+    return upload_stream(bucket_name, destination_blob_name, source, content_type)
+
+# Optional background upload queue: photo URLs are returned before the upload completes
+PHOTO_UPLOAD_QUEUE = None
+if os.environ.get('ASYNC_PHOTO_UPLOADS', '0') == '1':
+    PHOTO_UPLOAD_QUEUE = UploadQueue(
+        num_workers=int(os.environ.get('PHOTO_UPLOAD_WORKERS', 4)),
+        max_attempts=int(os.environ.get('PHOTO_UPLOAD_ATTEMPTS', 3)),
+    )
+
+# Resized WebP copies (e.g. threads/leaf_128.webp) stored next to each photo, so feeds
+# can download thumbnails instead of camera originals
+PHOTO_DERIVATIVES = None
+if os.environ.get('PHOTO_DERIVATIVES', '1') == '1':
+    PHOTO_DERIVATIVES = DerivativePipeline(
+        sizes=[int(size) for size in os.environ.get('PHOTO_DERIVATIVE_SIZES', '128,512').split(',')],
+        max_workers=int(os.environ.get('PHOTO_DERIVATIVE_WORKERS', os.cpu_count() or 1)),
+    )
+
+# Header-only checks shared by /predict, /threads and /profile/photo: unusable uploads
+# are rejected before any pixel data is decoded
+IMAGE_VALIDATOR = ImageValidator(
+    max_bytes=int(os.environ.get('UPLOAD_MAX_IMAGE_BYTES', 10 * 1024 * 1024)),
+    max_pixels=int(os.environ.get('UPLOAD_MAX_IMAGE_PIXELS', 64_000_000)),
+    max_side=int(os.environ.get('UPLOAD_MAX_IMAGE_SIDE', 12000)),
+    formats=os.environ.get('UPLOAD_IMAGE_FORMATS', 'JPEG,PNG,WEBP').split(','),
+)
 
-    # Upload the file to the bucket
-    blob.upload_from_filename(source_file_path)
+def store_photo(file, destination_blob_name, save, on_failure, on_derivatives=None):
+    """
+    Upload a photo, record its URL with `save(photo_url)` and return what `save` returns.
 
-    # Make the file publicly accessible
-    blob.make_public()
+    By default the request body is streamed straight to GCS and `save` only
+    runs once the upload succeeded, so a failed upload raises and leaves
+    nothing behind. With the upload queue enabled, `save` runs first with the
+    photo's deterministic URL and the bytes are uploaded in the background;
+    `on_failure` runs if every retry fails, and marks the saved document.
 
-    # Return the public URL
-    return blob.public_url
+    Derivatives are created in the background once the document is saved;
+    `on_derivatives(urls)` runs after all of them are stored, so the document
+    only links to objects that exist.
+    """
+    data = None
+    if PHOTO_UPLOAD_QUEUE is not None:
+        # The queue holds the bytes until its worker uploads them; derivatives share them
+        data = file.read()
+        saved = save(public_url(GCS_BUCKET_NAME, destination_blob_name))
+        PHOTO_UPLOAD_QUEUE.submit(GCS_BUCKET_NAME, destination_blob_name, data,
+                                  content_type=file.mimetype, on_failure=on_failure)
+    else:
+        # Derivatives then read the stored original back, so the upload is never buffered here
+        saved = save(upload_to_bucket(GCS_BUCKET_NAME, file.stream, destination_blob_name,
+                                      content_type=file.mimetype))
+
+    if PHOTO_DERIVATIVES is not None:
+        PHOTO_DERIVATIVES.submit(GCS_BUCKET_NAME, destination_blob_name, data, on_success=on_derivatives)
+    return saved
 
 db = firestore.client()
 
@@ -139,6 +201,7 @@ def update_email():
         # Update email in Firestore
         user_ref = db.collection('users').document(user['uid'])
         user_ref.update({'email': new_email})
+        invalidate_cached_user(user['uid'])
 
         return jsonify({
             'status': 'success',
@@ -305,6 +368,7 @@ def get_profile():
                 'location': profile.get('location'),
                 'about': profile.get('about'),
                 'profile_photo': profile.get('profile_photo'),
+                'profile_photo_derivatives': profile.get('profile_photo_derivatives'),
                 'region_name': profile.get('region_name'),
                 'created_threads': profile.get('created_threads')
             }
@@ -335,22 +399,25 @@ def upload_profile_photo():
         if not photo:
             return jsonify({'error': True, 'message': 'Invalid photo file'}), 400
 
-        # Save photo temporarily
-        filename = secure_filename(photo.filename)
-        temp_file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        photo.save(temp_file_path)
+        try:
+            IMAGE_VALIDATOR.validate(photo.stream)
+        except ImageRejected as e:
+            return jsonify({'error': True, 'message': str(e)}), e.status_code
 
-        # Upload photo to GCS
-        photo_url = upload_to_bucket(GCS_BUCKET_NAME, temp_file_path, f"profile_photos/{uid}/{filename}")
-        os.remove(temp_file_path)
+        filename = secure_filename(photo.filename)
+        blob_name = f"profile_photos/{uid}/{filename}"
 
-        # Update Firestore with the new photo URL
-        save_user_photo(uid, photo_url)
+        # Upload the photo to GCS and update Firestore with the new photo URL;
+        # the resized copies are added once they exist
+        photo_url = public_url(GCS_BUCKET_NAME, blob_name)
+        store_photo(photo, blob_name, save=lambda url: save_user_photo(uid, url),
+                    on_failure=lambda error: mark_profile_photo_pending(uid),
+                    on_derivatives=lambda urls: save_profile_photo_derivatives(uid, photo_url, urls))
 
         return jsonify({
             'status': 'success',
             'message': 'Profile photo updated successfully',
-            'data': {'profile_photo': photo_url}
+            'data': {'profile_photo': photo_url, 'profile_photo_derivatives': None}
         }), 200
 
     except Exception as e:
@@ -376,6 +443,7 @@ def update_name():
         # Update name in Firestore
         user_ref = db.collection('users').document(user_uid)
         user_ref.update({'name': name})
+        invalidate_cached_user(user_uid)
 
         return jsonify({
             'status': 'success',
@@ -405,8 +473,8 @@ def get_location_by_code():
         if not kode_wilayah:
             return jsonify({'error': True, 'message': 'kode_wilayah parameter is required'}), 400
 
-        # Cari nama wilayah di CSV berdasarkan kode wilayah
-        matching_region = find_name_by_code(all_regions, kode_wilayah)
+        # Cari nama wilayah berdasarkan kode wilayah
+        matching_region = region_index.get(kode_wilayah)
         if not matching_region:
             return jsonify({'error': True, 'message': f'No region found for kode_wilayah: {kode_wilayah}'}), 404
 
@@ -450,8 +518,8 @@ def update_location_by_code():
         if not kode_wilayah:
             return jsonify({'error': True, 'message': 'kode_wilayah is required'}), 400
 
-        # Cari nama wilayah di CSV berdasarkan kode wilayah
-        matching_region = find_name_by_code(all_regions, kode_wilayah)
+        # Cari nama wilayah berdasarkan kode wilayah
+        matching_region = region_index.get(kode_wilayah)
         if not matching_region:
             return jsonify({'error': True, 'message': f'No region found for kode_wilayah: {kode_wilayah}'}), 404
 
@@ -495,6 +563,7 @@ def update_about():
         # Update about in Firestore
         user_ref = db.collection('users').document(user_uid)
         user_ref.update({'about': about})
+        invalidate_cached_user(user_uid)
 
         return jsonify({
             'status': 'success',
@@ -521,33 +590,40 @@ def create_thread():
         if not body:
             return jsonify({'error': True, 'message': 'body is required'}), 400
         
-        photo_url = None
-        if 'photo' in request.files:
-            file = request.files['photo']
-            if file:
-                filename = secure_filename(file.filename)
-                temp_file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(temp_file_path)
-
-                # Upload to GCS
-                photo_url = upload_to_bucket(GCS_BUCKET_NAME, temp_file_path, f"threads/{filename}")
-                os.remove(temp_file_path)
-
         # Generate a unique thread ID
         thread_id = f"thread-{uuid.uuid4()}"
         created_at = firestore.SERVER_TIMESTAMP
 
-        # Save thread to Firestore
-        thread = save_thread_to_firestore(
-            thread_id=thread_id,
-            body=body,
-            owner_id=user['uid'],
-            created_at=created_at,
-            photo_url=photo_url,
-        )
-
-        # Tambahkan thread_id ke data user di Firestore
-        add_created_thread_to_user(user['uid'], thread_id)
+        photo = None
+        if 'photo' in request.files and request.files['photo']:
+            photo = request.files['photo']
+            try:
+                IMAGE_VALIDATOR.validate(photo.stream)
+            except ImageRejected as e:
+                return jsonify({'error': True, 'message': str(e)}), e.status_code
+            photo_blob_name = f"threads/{secure_filename(photo.filename)}"
+
+        def save_thread(photo_url=None):
+            # Save thread to Firestore
+            thread = save_thread_to_firestore(
+                thread_id=thread_id,
+                body=body,
+                owner_id=user['uid'],
+                created_at=created_at,
+                photo_url=photo_url,
+            )
+
+            # Tambahkan thread_id ke data user di Firestore
+            add_created_thread_to_user(user['uid'], thread_id)
+            return thread
+
+        # Upload to GCS
+        if photo is not None:
+            store_photo(photo, photo_blob_name, save=save_thread,
+                        on_failure=lambda error: mark_thread_photo_pending(thread_id),
+                        on_derivatives=lambda urls: set_thread_photo_derivatives(thread_id, urls))
+        else:
+            save_thread()
 
         # Retrieve saved thread with resolved timestamp
         saved_thread = db.collection('threads').document(thread_id).get().to_dict()
@@ -570,6 +646,7 @@ def fetch_threads():
         thread_id = request.args.get('thread_id')
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 10))
+        cursor = request.args.get('cursor')
 
         token = request.headers.get('Authorization')
         if not token:
@@ -584,8 +661,12 @@ def fetch_threads():
                 return jsonify({'error': True, 'message': f'Thread with ID {thread_id} not found'}), 404
             return jsonify({'status': 'success', 'data': {'thread': thread}}), 200
 
-        threads = get_all_threads(limit=limit, page=page)
-        return jsonify({'status': 'success', 'data': {'threads': threads}}), 200
+        # Prefer `cursor` (the previous response's nextCursor); `page` is kept for older clients
+        try:
+            threads, next_cursor = get_threads_page(limit=limit, page=page, cursor=cursor)
+        except ValueError:
+            return jsonify({'error': True, 'message': 'Invalid cursor'}), 400
+        return jsonify({'status': 'success', 'data': {'threads': threads, 'nextCursor': next_cursor}}), 200
 
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -699,6 +780,166 @@ with open('./utils/treatments.json') as f:
 
 CLASS_NAMES = load_class_names()
 BUCKET_NAME = "tanicare"
+MODEL_CACHE_DIR = os.environ.get('MODEL_CACHE_DIR', './model_cache')
+# Read models from a local directory instead of GCS (offline runs and benchmarks)
+MODEL_SOURCE_DIR = os.environ.get('MODEL_SOURCE_DIR')
+# Interpreters per plant model; each one serves a single request at a time
+INTERPRETER_POOL_SIZE = int(os.environ.get('INTERPRETER_POOL_SIZE', os.cpu_count() or 1))
+INTERPRETER_NUM_THREADS = int(os.environ['INTERPRETER_NUM_THREADS']) if os.environ.get('INTERPRETER_NUM_THREADS') else None
+# Written by benchmarks/autotune_interpreters.py; applied when INTERPRETER_NUM_THREADS is unset
+INTERPRETER_PROFILE_PATH = os.environ.get('INTERPRETER_PROFILE_PATH', './interpreter_profile.json')
+
+# Interpreters are loaded once per process and reused across requests
+MODEL_REGISTRY = get_model_registry(BUCKET_NAME, cache_dir=MODEL_CACHE_DIR,
+                                    pool_size=INTERPRETER_POOL_SIZE, num_threads=INTERPRETER_NUM_THREADS,
+                                    profile_path=INTERPRETER_PROFILE_PATH, model_dir=MODEL_SOURCE_DIR)
+if os.environ.get('WARM_MODELS', '0') == '1':
+    MODEL_REGISTRY.warm(model_name_for_plant(plant) for plant in CLASS_NAMES)
+# Poll model generations in the background and swap in retrained models; 0 disables
+MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 300))
+MODEL_REGISTRY.start_reload_watcher(MODEL_RELOAD_INTERVAL)
+
+# Opt-in micro-batching: concurrent requests for the same plant share one invoke
+BATCH_SCHEDULER = None
+if os.environ.get('PREDICT_BATCHING', '0') == '1':
+    BATCH_SCHEDULER = BatchScheduler(
+        MODEL_REGISTRY,
+        max_batch_size=int(os.environ.get('BATCH_MAX_SIZE', 8)),
+        max_wait_ms=float(os.environ.get('BATCH_MAX_WAIT_MS', 5)),
+        # One batch per interpreter in the plant's pool
+        max_in_flight=int(os.environ.get('BATCH_MAX_IN_FLIGHT', INTERPRETER_POOL_SIZE)),
+    )
+
+# Optional worker processes that decode and classify uploads outside the request thread
+INFERENCE_WORKER_POOL = None
+if int(os.environ.get('INFERENCE_WORKERS', 0)) > 0:
+    INFERENCE_WORKER_POOL = InferenceWorkerPool(
+        int(os.environ['INFERENCE_WORKERS']),
+        config={
+            'bucket_name': BUCKET_NAME,
+            'cache_dir': MODEL_CACHE_DIR,
+            'model_dir': MODEL_SOURCE_DIR,
+            'num_threads': INTERPRETER_NUM_THREADS,
+            'profile_path': INTERPRETER_PROFILE_PATH,
+            'reload_interval': MODEL_RELOAD_INTERVAL,
+        },
+        max_input_bytes=int(os.environ.get('INFERENCE_WORKER_MAX_IMAGE_BYTES', 16 * 1024 * 1024)),
+        request_timeout=float(os.environ.get('INFERENCE_WORKER_TIMEOUT', 30)),
+    )
+    atexit.register(INFERENCE_WORKER_POOL.close)
+
+# Results keyed by upload hash, plant and model version; retried uploads skip inference
+PREDICTION_CACHE = ResultCache(
+    max_entries=int(os.environ.get('PREDICTION_CACHE_SIZE', 1024)),
+    ttl_seconds=float(os.environ.get('PREDICTION_CACHE_TTL', 3600)),
+)
+
+# Admission control for /predict: past these limits requests get a fast 503 instead of
+# queueing behind every other download, decode and invoke
+PREDICT_MAX_CONCURRENT = int(os.environ.get('PREDICT_MAX_CONCURRENT', INTERPRETER_POOL_SIZE * 2))
+PREDICT_ADMISSION = AdmissionController(
+    PREDICT_MAX_CONCURRENT,
+    max_queue=int(os.environ.get('PREDICT_MAX_QUEUE', 32)),
+    queue_timeout=float(os.environ.get('PREDICT_QUEUE_TIMEOUT', 2)),
+    # By default one plant may take at most half the slots, so a burst for it cannot starve the others
+    default_per_key=int(os.environ.get('PREDICT_MAX_CONCURRENT_PER_PLANT', max(1, PREDICT_MAX_CONCURRENT // 2))),
+    # e.g. "corn=4,rice=2"
+    per_key_limits={plant: int(limit) for plant, limit in
+                    (item.split('=') for item in os.environ.get('PREDICT_PLANT_LIMITS', '').split(',') if item)},
+)
+
+def overloaded_response(error):
+    """503 for a shed prediction request, telling the client when to retry."""
+    return jsonify({'error': True, 'message': str(error)}), 503, {'Retry-After': str(error.retry_after)}
+
+# Limits for /predict/<plant>/batch
+PREDICT_BATCH_MAX_IMAGES = int(os.environ.get('PREDICT_BATCH_MAX_IMAGES', 64))
+PREDICT_BATCH_INVOKE_SIZE = int(os.environ.get('PREDICT_BATCH_INVOKE_SIZE', 32))
+PREDICT_BATCH_MAX_IMAGE_BYTES = int(os.environ.get('PREDICT_BATCH_MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+
+def read_zip_images(archive):
+    """Return (filename, bytes) for every file in an uploaded zip, skipping directories."""
+    images = []
+    with zipfile.ZipFile(archive.stream) as zip_file:
+        for info in zip_file.infolist():
+            if info.is_dir() or os.path.basename(info.filename).startswith('.'):
+                continue
+            if len(images) >= PREDICT_BATCH_MAX_IMAGES:
+                raise ValueError(f'archive holds more than {PREDICT_BATCH_MAX_IMAGES} files')
+            if info.file_size > PREDICT_BATCH_MAX_IMAGE_BYTES:
+                raise ValueError(f'{info.filename} is larger than {PREDICT_BATCH_MAX_IMAGE_BYTES} bytes')
+            images.append((info.filename, zip_file.read(info)))
+    return images
+
+def preprocess_for_model(model, image_source, out=None):
+    """Decode an image into the input size and dtype the loaded model expects."""
+    return preprocess_for_spec(model.input_spec, image_source, out=out)
+
+def run_prediction(model, input_data):
+    """
+    Run one preprocessed image through the model, batched with other requests if enabled.
+
+    Returns the predictions and the version of the model that produced them.
+    """
+    if BATCH_SCHEDULER is not None:
+        return BATCH_SCHEDULER.predict(model.name, input_data)
+    return model.run_inference(input_data), model.version
+
+def build_prediction_result(plant, predictions):
+    """Turn one row of model output into the predicted class and treatment for a plant."""
+    # Get prediction details
+    predicted_class_idx = np.argmax(predictions)
+    prediction_probabilities = {}
+
+    # Get class names for the plant
+    plant_classes = CLASS_NAMES[plant.lower()]
+
+    # Calculate probabilities for each class
+    for idx, prob in enumerate(predictions):
+        if idx in plant_classes:
+            class_name = plant_classes[idx]
+            prediction_probabilities[class_name] = float(prob)
+
+    predicted_class_name = plant_classes.get(predicted_class_idx, "Penyakit Tidak Diketahui")
+    treatment = TREATMENTS[plant].get(predicted_class_name, "Tidak ada informasi terkait penyakit.")
+
+    return {
+        'plant': plant,
+        'predicted_class': predicted_class_name,
+        'treatment': treatment,
+    }
+
+def predict_image(plant, image_bytes):
+    """Return the prediction result for one upload, reusing a cached result when possible."""
+    model_name = model_name_for_plant(plant)
+    model = None
+    if INFERENCE_WORKER_POOL is not None:
+        # Interpreters live in the workers; key the cache on the version they last reported
+        model_version = INFERENCE_WORKER_POOL.model_version(model_name)
+    else:
+        # Hold on to one model version for the whole request, even if a reload swaps it meanwhile
+        model = MODEL_REGISTRY.get(model_name)
+        model_version = model.version
+
+    # Identical uploads against the same model version reuse the earlier result
+    if model_version is not None:
+        result = PREDICTION_CACHE.get(content_key(image_bytes, plant, model_version))
+        if result is not None:
+            return result
+
+    if model is None:
+        predictions, model_version = INFERENCE_WORKER_POOL.predict(model_name, image_bytes)
+    else:
+        # Preprocess the image
+        input_data = preprocess_for_model(model, image_bytes)
+
+        # Run inference on the cached interpreter and get predictions
+        predictions, model_version = run_prediction(model, input_data)
+
+    result = build_prediction_result(plant, predictions)
+    result['model_version'] = model_version
+    PREDICTION_CACHE.set(content_key(image_bytes, plant, model_version), result)
+    return result
 
 @app.route('/predict/<plant>', methods=['POST'])
 def predict_disease(plant):
@@ -719,47 +960,141 @@ def predict_disease(plant):
         if not file:
             return jsonify({'error': True, 'message': 'Invalid image file'}), 400
 
-        # Save uploaded file temporarily
-        filename = secure_filename(file.filename)
-        temp_image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(temp_image_path)
+        # Check format, size and dimensions from the header before anything is decoded
+        try:
+            IMAGE_VALIDATOR.validate(file.stream)
+        except ImageRejected as e:
+            return jsonify({'error': True, 'message': str(e)}), e.status_code
 
-        # Load the model
-        model_name = f"{plant.capitalize()}.tflite"
-        interpreter = load_tflite_model_from_gcs(BUCKET_NAME, model_name)
+        with PREDICT_ADMISSION.admit(plant):
+            # Read the upload into memory; nothing is written to disk
+            image_bytes = file.read()
 
-        # Preprocess the image
-        input_data = preprocess_image(temp_image_path, target_size=(150, 150))
+            result = predict_image(plant, image_bytes)
+
+        return jsonify({
+            'status': 'success',
+            'message': 'Prediction completed',
+            'data': result
+        }), 200
 
-        # Run inference and get predictions
-        predictions = run_tflite_inference(interpreter, input_data)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({'error': True, 'message': str(e)}), 500
 
-        # Get prediction details
-        predicted_class_idx = np.argmax(predictions)
-        prediction_probabilities = {}
-        
-        # Get class names for the plant
-        plant_classes = CLASS_NAMES[plant.lower()]
-        
-        # Calculate probabilities for each class
-        for idx, prob in enumerate(predictions):
-            if idx in plant_classes:
-                class_name = plant_classes[idx]
-                prediction_probabilities[class_name] = float(prob)
+@app.route('/predict/<plant>/batch', methods=['POST'])
+def predict_disease_batch(plant):
+    """
+    Predict plant disease for many images in one request.
 
-        predicted_class_name = plant_classes.get(predicted_class_idx, "Penyakit Tidak Diketahui")
-        treatment = TREATMENTS[plant].get(predicted_class_name, "Tidak ada informasi terkait penyakit.")
+    Accepts several `image` parts and/or one zip file in `archive`. Images are
+    stacked into one array and run through the model in as few invokes as
+    possible; a bad image gets its own error entry instead of failing the batch.
+    """
+    try:
+        if plant not in TREATMENTS:
+            return jsonify({'error': True, 'message': f'Unsupported plant type: {plant}'}), 400
+
+        if plant not in CLASS_NAMES:
+            return jsonify({'error': True, 'message': f'No class definitions for plant type: {plant}'}), 400
 
-        # Clean up temporary files
-        os.remove(temp_image_path)
+        files = [file for file in request.files.getlist('image') if file]
+        archive = request.files.get('archive')
+        if not files and not archive:
+            return jsonify({'error': True, 'message': 'No image files provided'}), 400
+
+        if len(files) > PREDICT_BATCH_MAX_IMAGES:
+            return jsonify({'error': True, 'message': f'Too many images, maximum is {PREDICT_BATCH_MAX_IMAGES}'}), 400
+
+        # A batch holds one slot for its plant for as long as it runs, and only
+        # reads its images into memory once it has that slot
+        with PREDICT_ADMISSION.admit(plant):
+            # Anything past the size limit is cut off here and rejected by the validator below
+            uploads = [(file.filename, file.read(PREDICT_BATCH_MAX_IMAGE_BYTES + 1)) for file in files]
+            if archive:
+                try:
+                    uploads.extend(read_zip_images(archive))
+                except (zipfile.BadZipFile, ValueError) as e:
+                    return jsonify({'error': True, 'message': f'Invalid archive: {e}'}), 400
+
+            if not uploads:
+                return jsonify({'error': True, 'message': 'No image files provided'}), 400
+
+            if len(uploads) > PREDICT_BATCH_MAX_IMAGES:
+                return jsonify({'error': True, 'message': f'Too many images, maximum is {PREDICT_BATCH_MAX_IMAGES}'}), 400
+
+            model = MODEL_REGISTRY.get(model_name_for_plant(plant))
+            results = [None] * len(uploads)
+
+            # Decode every image straight into its row of one stacked batch
+            spec = model.input_spec
+            width, height = spec.target_size
+            batch = np.empty((len(uploads), height, width, 3), dtype=spec.dtype if spec.is_quantized else np.float32)
+            batch_positions = []
+            for position, (filename, image_bytes) in enumerate(uploads):
+                try:
+                    IMAGE_VALIDATOR.validate(image_bytes)
+                    preprocess_for_model(model, image_bytes, out=batch[len(batch_positions)])
+                    batch_positions.append(position)
+                except Exception as e:
+                    results[position] = {'filename': filename, 'error': True, 'message': f'Could not read image: {e}'}
+
+            # Run the decoded rows through the model in chunks of the invoke size; a short chunk
+            # runs on interpreters for the next power of two, so it is padded by less than half
+            for start in range(0, len(batch_positions), PREDICT_BATCH_INVOKE_SIZE):
+                chunk_positions = batch_positions[start:start + PREDICT_BATCH_INVOKE_SIZE]
+                try:
+                    outputs = model.run_batch_inference(
+                        batch[start:start + len(chunk_positions)],
+                        batch_size=batch_capacity(len(chunk_positions), PREDICT_BATCH_INVOKE_SIZE))
+                except Exception as e:
+                    for position in chunk_positions:
+                        results[position] = {'filename': uploads[position][0], 'error': True, 'message': str(e)}
+                    continue
+                for position, predictions in zip(chunk_positions, outputs):
+                    result = build_prediction_result(plant, predictions)
+                    result['filename'] = uploads[position][0]
+                    result['error'] = False
+                    results[position] = result
 
         return jsonify({
             'status': 'success',
-            'message': 'Prediction completed',
+            'message': 'Batch prediction completed',
             'data': {
                 'plant': plant,
-                'predicted_class': predicted_class_name,
-                'treatment': treatment,
+                'model_version': model.version,
+                'total': len(results),
+                'failed': sum(1 for result in results if result['error']),
+                'predictions': results,
+            }
+        }), 200
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except RequestEntityTooLarge:
+        return jsonify({'error': True, 'message': f"Request is larger than {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+    except Exception as e:
+        return jsonify({'error': True, 'message': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Expose internal cache and inference statistics for monitoring.
+    """
+    try:
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'models': MODEL_REGISTRY.stats(),
+                'batching': BATCH_SCHEDULER.stats() if BATCH_SCHEDULER is not None else None,
+                'prediction_cache': PREDICTION_CACHE.stats(),
+                'inference_workers': INFERENCE_WORKER_POOL.stats() if INFERENCE_WORKER_POOL is not None else None,
+                'photo_uploads': PHOTO_UPLOAD_QUEUE.stats() if PHOTO_UPLOAD_QUEUE is not None else None,
+                'photo_derivatives': PHOTO_DERIVATIVES.stats() if PHOTO_DERIVATIVES is not None else None,
+                'image_validation': IMAGE_VALIDATOR.stats(),
+                'predict_admission': PREDICT_ADMISSION.stats(),
+                'user_cache': USER_CACHE.stats(),
             }
         }), 200
 
@@ -767,7 +1102,103 @@ def predict_disease(plant):
         return jsonify({'error': True, 'message': str(e)}), 500
 
 WILAYAH_FILEPATH = "data/base.csv"
-all_regions = load_all_regions(WILAYAH_FILEPATH)
+# Compiled with `python -m models.region_store`; workers memory-map it and share its pages.
+# Without it the CSV is parsed into an in-memory index with the same lookups.
+REGION_INDEX_PATH = os.environ.get('REGION_INDEX_PATH', 'data/regions.idx')
+region_index = load_region_index(WILAYAH_FILEPATH, REGION_INDEX_PATH)
+# Trigram index for infix and typo-tolerant search, mapped from regions.idx. Over the CSV
+# fallback it is built in memory, which takes about a second, so that happens in the
+# background at startup instead of inside the first /region_search
+region_search = RegionSearch(region_index)
+if not region_search.built:
+    threading.Thread(target=region_search.build, name='region-search-build', daemon=True).start()
+REGION_SEARCH_MAX_LIMIT = 50
+# /region_code pages; ?stream=1 returns every match as a chunked JSON array instead
+REGION_CODE_PAGE_SIZE = int(os.environ.get('REGION_CODE_PAGE_SIZE', 100))
+REGION_CODE_MAX_PAGE_SIZE = int(os.environ.get('REGION_CODE_MAX_PAGE_SIZE', 1000))
+
+def encode_region_cursor(position):
+    return base64.urlsafe_b64encode(str(position).encode()).decode()
+
+def decode_region_cursor(cursor):
+    # Raises ValueError for anything encode_region_cursor did not produce
+    if not cursor:
+        return None
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+# The region data only changes with a deploy, so the CSV's hash versions every region response
+REGION_DATASET_VERSION = region_index.source_sha256.hex()[:16]
+# Bump whenever a region endpoint changes what its body looks like (2: paged /region_code)
+REGION_RESPONSE_FORMAT = 2
+# Clients and CDNs revalidate with this; it changes with the data, the response format and
+# the page-size settings, since each of them changes the bodies behind the same URLs
+REGION_ETAG = (f"{REGION_DATASET_VERSION}-f{REGION_RESPONSE_FORMAT}"
+               f"-p{REGION_CODE_PAGE_SIZE}-{REGION_CODE_MAX_PAGE_SIZE}-s{REGION_SEARCH_MAX_LIMIT}")
+REGION_CACHE_MAX_AGE = int(os.environ.get('REGION_CACHE_MAX_AGE', 86400))
+# Default /region_name and /region_code responses for every name prefix up to this length,
+# serialized once in the background at startup; 0 disables
+REGION_PRECOMPUTE_PREFIX_LENGTH = int(os.environ.get('REGION_PRECOMPUTE_PREFIX_LENGTH', 3))
+REGION_PRECOMPUTED = {}
+
+def cache_region_response(response):
+    """Let clients and proxies keep a region response until the dataset or response format changes."""
+    response.set_etag(REGION_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = REGION_CACHE_MAX_AGE
+    return response
+
+def region_not_modified():
+    """A 304 when the client already holds this version of the response, otherwise None."""
+    if request.if_none_match.contains_weak(REGION_ETAG):
+        return cache_region_response(Response(status=304))
+    return None
+
+def region_json_response(body):
+    return cache_region_response(Response(body, mimetype='application/json'))
+
+def region_name_payload(query):
+    # Get matching regions (limited to 10 results)
+    suggestions = region_index.suggest_by_name(query)
+    if not suggestions:
+        return {'status': 'success', 'message': 'No matches found', 'data': []}
+    return {'status': 'success', 'data': suggestions}
+
+def region_code_payload(query, after, limit):
+    matching_codes, next_after = region_index.codes_by_name_page(query, after=after, limit=limit)
+    next_cursor = encode_region_cursor(next_after) if next_after is not None else None
+    if not matching_codes:
+        return {'status': 'success', 'message': 'No matches found', 'data': [], 'nextCursor': None}
+    return {'status': 'success', 'data': matching_codes, 'nextCursor': next_cursor}
+
+def precompute_region_responses():
+    prefixes = set()
+    for position in range(len(region_index)):
+        name = region_index.region_at(position)['name'].lower()
+        for length in range(1, REGION_PRECOMPUTE_PREFIX_LENGTH + 1):
+            prefixes.add(name[:length])
+    for prefix in sorted(prefixes):
+        REGION_PRECOMPUTED[('region_name', prefix)] = json.dumps(region_name_payload(prefix)).encode()
+        REGION_PRECOMPUTED[('region_code', prefix)] = json.dumps(
+            region_code_payload(prefix, None, REGION_CODE_PAGE_SIZE)).encode()
+
+if REGION_PRECOMPUTE_PREFIX_LENGTH > 0:
+    # Requests that arrive before this finishes are computed as usual
+    threading.Thread(target=precompute_region_responses, name='region-precompute', daemon=True).start()
+
+def stream_region_codes(query, batch_size=256):
+    """Write the matches for a query as a JSON array while iterating the index, in name order."""
+    yield '{"status": "success", "data": ['
+    separator = ''
+    batch = []
+    for entry in region_index.iter_codes_by_name(query):
+        batch.append(json.dumps(entry))
+        if len(batch) == batch_size:
+            yield separator + ','.join(batch)
+            separator = ','
+            batch = []
+    if batch:
+        yield separator + ','.join(batch)
+    yield ']}'
 
 @app.route('/region_name', methods=['GET'])
 def get_suggestions_by_name():
@@ -779,12 +1210,14 @@ def get_suggestions_by_name():
         if not query:
             return jsonify({'error': True, 'message': 'Query parameter is required'}), 400
 
-        # Get matching regions (limited to 10 results)
-        suggestions = suggest_regions_by_name(all_regions, query)
-        if not suggestions:
-            return jsonify({'status': 'success', 'message': 'No matches found', 'data': []}), 200
+        not_modified = region_not_modified()
+        if not_modified is not None:
+            return not_modified
 
-        return jsonify({'status': 'success', 'data': suggestions}), 200
+        body = REGION_PRECOMPUTED.get(('region_name', query.lower()))
+        if body is None:
+            body = json.dumps(region_name_payload(query)).encode()
+        return region_json_response(body)
 
     except Exception as e:
         return jsonify({'error': True, 'message': str(e)}), 500
@@ -792,24 +1225,122 @@ def get_suggestions_by_name():
 @app.route('/region_code', methods=['GET'])
 def get_codes_by_region_name():
     """
-    Get region codes by searching with region name.
+    Get region codes by searching with region name, one page at a time.
     """
     try:
         query = request.args.get('query')
         if not query:
             return jsonify({'error': True, 'message': 'Query parameter is required'}), 400
 
-        # Get matching region codes
-        matching_codes = get_codes_by_name(all_regions, query)
-        if not matching_codes:
-            return jsonify({'status': 'success', 'message': 'No matches found', 'data': []}), 200
+        not_modified = region_not_modified()
+        if not_modified is not None:
+            return not_modified
+
+        if request.args.get('stream') == '1':
+            # Chunked response; nothing holds the full list of matches
+            return cache_region_response(
+                Response(stream_with_context(stream_region_codes(query)), mimetype='application/json'))
+
+        try:
+            limit = int(request.args.get('limit', REGION_CODE_PAGE_SIZE))
+            after = decode_region_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': True, 'message': 'Invalid limit or cursor'}), 400
+        if limit < 1:
+            return jsonify({'error': True, 'message': 'limit must be at least 1'}), 400
+        limit = min(limit, REGION_CODE_MAX_PAGE_SIZE)
+
+        body = None
+        if after is None and limit == REGION_CODE_PAGE_SIZE:
+            body = REGION_PRECOMPUTED.get(('region_code', query.lower()))
+        if body is None:
+            # Get matching region codes
+            body = json.dumps(region_code_payload(query, after, limit)).encode()
+        return region_json_response(body)
+
+    except Exception as e:
+        return jsonify({'error': True, 'message': str(e)}), 500
+
+@app.route('/region_search', methods=['GET'])
+def search_regions():
+    """
+    Search regions by any part of their name, tolerating small typos.
+    """
+    try:
+        query = request.args.get('query')
+        if not query:
+            return jsonify({'error': True, 'message': 'Query parameter is required'}), 400
+
+        not_modified = region_not_modified()
+        if not_modified is not None:
+            return not_modified
+
+        limit = int(request.args.get('limit', 10))
+        max_distance = request.args.get('max_distance')
+        max_distance = int(max_distance) if max_distance is not None else None
+        if limit < 1:
+            return jsonify({'error': True, 'message': 'limit must be at least 1'}), 400
+        limit = min(limit, REGION_SEARCH_MAX_LIMIT)
+
+        results = region_search.search(query, limit=limit, max_distance=max_distance)
+        if not results:
+            return cache_region_response(jsonify({'status': 'success', 'message': 'No matches found', 'data': []})), 200
 
-        return jsonify({'status': 'success', 'data': matching_codes}), 200
+        return cache_region_response(jsonify({'status': 'success', 'data': results})), 200
+
+    except ValueError:
+        return jsonify({'error': True, 'message': 'limit and max_distance must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': True, 'message': str(e)}), 500
+
+def region_summary(region):
+    return {
+        'kode_wilayah': region['kode_wilayah'],
+        'name': region['name'],
+        'level': region_level(region['kode_wilayah']),
+    }
+
+@app.route('/regions', methods=['GET'])
+def get_provinces():
+    """
+    List all provinces, the top of the region picker.
+    """
+    try:
+        not_modified = region_not_modified()
+        if not_modified is not None:
+            return not_modified
+
+        provinces = [region_summary(region) for region in region_index.children()]
+        return cache_region_response(jsonify({'status': 'success', 'data': provinces})), 200
+
+    except Exception as e:
+        return jsonify({'error': True, 'message': str(e)}), 500
+
+@app.route('/regions/<kode_wilayah>/children', methods=['GET'])
+def get_region_children(kode_wilayah):
+    """
+    List the regions directly below a kode wilayah (province -> regency -> district -> village).
+    """
+    try:
+        not_modified = region_not_modified()
+        if not_modified is not None:
+            return not_modified
+
+        region = region_index.get(kode_wilayah)
+        if not region:
+            return jsonify({'error': True, 'message': f'No region found for kode_wilayah: {kode_wilayah}'}), 404
+
+        return cache_region_response(jsonify({
+            'status': 'success',
+            'data': {
+                'region': region_summary(region),
+                'ancestors': [region_summary(ancestor) for ancestor in region_index.ancestors(kode_wilayah)],
+                'children': [region_summary(child) for child in region_index.children(kode_wilayah)],
+            }
+        })), 200
 
     except Exception as e:
         return jsonify({'error': True, 'message': str(e)}), 500
 
 if __name__ == '__main__':
-    if not os.path.exists(app.config['UPLOAD_FOLDER']):
-        os.makedirs(app.config['UPLOAD_FOLDER'])
     app.run(debug=True, host='0.0.0.0', port=8080)
@@ -0,0 +1,100 @@
+"""
+Pick the fastest interpreter settings for each plant model on this machine.
+
+Every model is benchmarked under candidate thread counts and delegate settings
+(XNNPACK, plain builtin kernels, and any external delegate libraries passed
+with --delegate). The winners are written to the interpreter profile under
+this machine's CPU count, and the model registry applies them automatically
+when it creates interpreters. Run from the flask_app directory:
+
+    python benchmarks/autotune_interpreters.py --profile interpreter_profile.json
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.tflite_model import (
+    InputSpec,
+    TFLiteModelRegistry,
+    create_interpreter,
+    load_class_names,
+    machine_profile_key,
+    model_name_for_plant,
+    run_tflite_inference,
+    save_interpreter_profile,
+)
+
+def candidate_thread_counts(cpu_count):
+    counts = {1, cpu_count}
+    count = 2
+    while count < cpu_count:
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+def random_input(spec):
+    rng = np.random.default_rng(0)
+    if spec.is_quantized:
+        return spec.from_pixels(rng.integers(0, 256, size=spec.shape[1:], dtype=np.uint8))[np.newaxis]
+    return spec.from_float(rng.random(spec.shape, dtype=np.float32))
+
+def benchmark(content, num_threads, delegate, warmup, runs):
+    interpreter = create_interpreter(content, num_threads=num_threads, delegate=delegate)
+    input_data = random_input(InputSpec(interpreter.get_input_details()[0]))
+    for _ in range(warmup):
+        run_tflite_inference(interpreter, input_data)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_tflite_inference(interpreter, input_data)
+        latencies.append(time.perf_counter() - start)
+    return float(np.median(latencies)) * 1000, float(np.percentile(latencies, 95)) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', default='./interpreter_profile.json', help='Profile file to update')
+    parser.add_argument('--bucket', default='tanicare')
+    parser.add_argument('--cache-dir', default='./model_cache', help='Model cache used before downloading from GCS')
+    parser.add_argument('--plants', nargs='*', help='Plants to tune (default: all in class_names.json)')
+    parser.add_argument('--delegate', action='append', default=[], help='Extra external delegate library to try')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    plants = args.plants or list(load_class_names())
+    registry = TFLiteModelRegistry(args.bucket, cache_dir=args.cache_dir)
+    thread_counts = candidate_thread_counts(os.cpu_count() or 1)
+    delegates = ['xnnpack', 'none'] + args.delegate
+
+    print(f"Tuning for machine '{machine_profile_key()}': threads {thread_counts}, delegates {delegates}")
+    settings = {}
+    for plant in plants:
+        model_name = model_name_for_plant(plant)
+        content = registry.fetch_content(model_name)[0]
+        best = None
+        for delegate in delegates:
+            for num_threads in thread_counts:
+                try:
+                    median_ms, p95_ms = benchmark(content, num_threads, delegate, args.warmup, args.runs)
+                except Exception as e:
+                    print(f"  {model_name} threads={num_threads} delegate={delegate}: failed ({e})")
+                    continue
+                print(f"  {model_name} threads={num_threads} delegate={delegate}: "
+                      f"median {median_ms:.2f} ms, p95 {p95_ms:.2f} ms")
+                if best is None or median_ms < best['median_ms']:
+                    best = {'num_threads': num_threads, 'delegate': delegate,
+                            'median_ms': round(median_ms, 3), 'p95_ms': round(p95_ms, 3)}
+        if best is not None:
+            settings[model_name] = best
+            print(f"{model_name}: threads={best['num_threads']} delegate={best['delegate']}")
+
+    save_interpreter_profile(args.profile, settings)
+    print(f"Wrote {len(settings)} model profiles to {args.profile}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare a float plant model with a quantized (int8 / float16) variant of it.
+
+Every image is run through both models using the preprocessing path each one
+expects. Reports per-invoke latency and how often both models agree on the
+top-1 class. Run from the flask_app directory:
+
+    python benchmarks/compare_quantized.py --float Corn.tflite --quantized Corn_int8.tflite --images samples/corn
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.tflite_model import InputSpec, create_interpreter, run_tflite_inference
+from utils.image_preprocess import load_image_pixels
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+def prepare_input(spec, image_path):
+    pixels = load_image_pixels(image_path, spec.target_size)
+    if spec.is_quantized:
+        return spec.from_pixels(pixels)[np.newaxis]
+    input_data = (pixels.astype(np.float32) / 255.0)[np.newaxis]
+    return spec.from_float(input_data)
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--float', dest='float_model', required=True, help='Reference float32 .tflite file')
+    parser.add_argument('--quantized', required=True, help='Quantized .tflite file for the same plant')
+    parser.add_argument('--images', required=True, help='Directory of sample leaf photos')
+    parser.add_argument('--num-threads', type=int, default=None)
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    image_paths = sorted(
+        os.path.join(args.images, name) for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not image_paths:
+        parser.error(f"No images found in {args.images}")
+
+    models = {}
+    for label, path in (('float', args.float_model), ('quantized', args.quantized)):
+        with open(path, 'rb') as f:
+            content = f.read()
+        interpreter = create_interpreter(content, num_threads=args.num_threads)
+        models[label] = {
+            'path': path,
+            'size_bytes': len(content),
+            'interpreter': interpreter,
+            'spec': InputSpec(interpreter.get_input_details()[0]),
+            'latencies': [],
+            'top1': [],
+        }
+
+    for image_path in image_paths:
+        for model in models.values():
+            input_data = prepare_input(model['spec'], image_path)
+            start = time.perf_counter()
+            predictions = run_tflite_inference(model['interpreter'], input_data)
+            model['latencies'].append(time.perf_counter() - start)
+            model['top1'].append(int(np.argmax(predictions)))
+
+    agreement = np.mean(np.array(models['float']['top1']) == np.array(models['quantized']['top1']))
+    results = {'images': len(image_paths), 'top1_agreement': round(float(agreement), 4), 'models': {}}
+    for label, model in models.items():
+        results['models'][label] = {
+            'path': model['path'],
+            'size_bytes': model['size_bytes'],
+            'input': model['spec'].describe(),
+            'p50_ms': round(percentile(model['latencies'], 50), 3),
+            'p95_ms': round(percentile(model['latencies'], 95), 3),
+            'mean_ms': round(float(np.mean(model['latencies'])) * 1000, 3),
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Offline benchmark of the prediction path, stage by stage.
+
+Synthetic TFLite models (see synthetic_models.py) are served from a local
+directory instead of GCS, and synthetic JPEG uploads stand in for leaf photos.
+Latency percentiles and throughput are reported for:
+
+    decode_resize   preprocess_image on the uploaded bytes
+    invoke          one inference on a pooled interpreter
+    postprocess     build_prediction_result on the model output
+    route           POST /predict/<plant> through the Flask test client
+
+Results are written as JSON so runs can be compared across commits. Run from
+the flask_app directory:
+
+    python benchmarks/inference_suite.py --output bench_results/head.json
+    python benchmarks/inference_suite.py --compare bench_results/head.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+FLASK_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FLASK_APP_DIR)
+
+def make_jpeg(width, height, seed):
+    """A smooth gradient with some noise, so it compresses like a photo rather than pure noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    noisy = np.clip(base + rng.normal(0, 12, size=base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(noisy).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+def summarize(latencies):
+    latencies = np.array(latencies)
+    return {
+        'iterations': int(latencies.size),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+        'mean_ms': round(float(latencies.mean()) * 1000, 3),
+        'throughput_per_s': round(float(latencies.size / latencies.sum()), 2) if latencies.sum() > 0 else None,
+    }
+
+def time_stage(func, iterations, warmup):
+    for _ in range(warmup):
+        func()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+def import_app():
+    """Import app.py with Firebase initialization stubbed out, since no credentials exist offline."""
+    patches = [
+        mock.patch('firebase_admin.credentials.Certificate'),
+        mock.patch('firebase_admin.initialize_app'),
+        mock.patch('firebase_admin.firestore.client'),
+    ]
+    for patch in patches:
+        patch.start()
+    import app
+    return app
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=FLASK_APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for stage, stats in results['stages'].items():
+        old = baseline.get('stages', {}).get(stage)
+        if not old or 'p50_ms' not in stats or 'p50_ms' not in old:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            delta = (stats[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            changes.append(f"{key} {old[key]:.2f} -> {stats[key]:.2f} ({delta:+.1f}%)")
+        print(f"  {stage:>14}: " + ', '.join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--plant', default='corn')
+    parser.add_argument('--model-dir', help='Directory with <Plant>.tflite files (default: generate synthetic models)')
+    parser.add_argument('--image-size', default='1600x1200', help='Synthetic upload size, WIDTHxHEIGHT')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    os.chdir(FLASK_APP_DIR)
+    model_dir = args.model_dir
+    if model_dir is None:
+        from benchmarks.synthetic_models import generate_models
+        model_dir = tempfile.mkdtemp(prefix='tanicare_models_')
+        generate_models(model_dir)
+
+    # Configure the app before import: local models, no disk cache, no result cache
+    os.environ['MODEL_SOURCE_DIR'] = model_dir
+    os.environ['MODEL_CACHE_DIR'] = ''
+    os.environ['PREDICTION_CACHE_SIZE'] = '0'
+
+    from utils.image_preprocess import preprocess_image
+    from utils.tflite_model import get_interpreter_backend, model_name_for_plant
+
+    width, height = (int(value) for value in args.image_size.split('x'))
+    uploads = [make_jpeg(width, height, seed) for seed in range(8)]
+    model_name = model_name_for_plant(args.plant)
+
+    app_module = import_app()
+    registry = app_module.MODEL_REGISTRY
+    registry.get(model_name)
+
+    counter = {'i': 0}
+    def next_upload():
+        counter['i'] += 1
+        return uploads[counter['i'] % len(uploads)]
+
+    input_data = np.array(preprocess_image(uploads[0], target_size=(150, 150)))
+    predictions = registry.run_inference(model_name, input_data)
+
+    def post_prediction():
+        response = client.post(f'/predict/{args.plant}', data={'image': (io.BytesIO(next_upload()), 'leaf.jpg')},
+                               content_type='multipart/form-data')
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict returned {response.status_code}: {response.get_data(as_text=True)}")
+
+    client = app_module.app.test_client()
+    stages = {
+        'decode_resize': lambda: preprocess_image(next_upload(), target_size=(150, 150)),
+        'invoke': lambda: registry.run_inference(model_name, input_data),
+        'postprocess': lambda: app_module.build_prediction_result(args.plant, predictions),
+        'route': post_prediction,
+    }
+
+    results = {
+        'commit': current_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'config': {'plant': args.plant, 'image_size': args.image_size, 'iterations': args.iterations,
+                   'backend': get_interpreter_backend().name, 'model_dir': model_dir},
+        'stages': {},
+    }
+    for stage, func in stages.items():
+        results['stages'][stage] = time_stage(func, args.iterations, args.warmup)
+        stats = results['stages'][stage]
+        print(f"{stage:>14}: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+              f"p99 {stats['p99_ms']:.2f} ms, {stats['throughput_per_s']}/s")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of region name lookups: linear scan vs RegionIndex.
+
+Queries are prefixes of real region names (1 to 6 characters, the way they
+arrive while a user types) plus some that match nothing. Both
+implementations must return identical results. Run from the flask_app
+directory:
+
+    python benchmarks/region_lookup.py
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+FLASK_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FLASK_APP_DIR)
+
+from models.wilayah_lookup import RegionIndex, get_codes_by_name, load_all_regions, suggest_regions_by_name
+
+def sample_queries(regions, count, seed):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        name = rng.choice(regions)['name']
+        queries.append(name[:rng.randint(1, min(6, len(name)))])
+    # Misses are the worst case for the linear scan
+    queries += ['zzq', 'Xylo', 'qqq', '9x']
+    return queries
+
+def time_queries(func, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            func(query)
+    return (time.perf_counter() - start) / (repeat * len(queries))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=os.path.join(FLASK_APP_DIR, 'data', 'base.csv'))
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    regions = load_all_regions(args.csv)
+    start = time.perf_counter()
+    index = RegionIndex(regions)
+    build_seconds = time.perf_counter() - start
+    print(f"{len(regions)} regions, index built in {build_seconds * 1000:.1f} ms")
+
+    queries = sample_queries(regions, args.queries, args.seed)
+    for query in queries:
+        if suggest_regions_by_name(regions, query) != index.suggest_by_name(query):
+            raise AssertionError(f"suggestions differ for {query!r}")
+        if get_codes_by_name(regions, query) != index.codes_by_name(query):
+            raise AssertionError(f"codes differ for {query!r}")
+
+    cases = [
+        ('suggest', lambda query: suggest_regions_by_name(regions, query), index.suggest_by_name),
+        ('codes', lambda query: get_codes_by_name(regions, query), index.codes_by_name),
+    ]
+    for label, linear, indexed in cases:
+        linear_seconds = time_queries(linear, queries, args.repeat)
+        indexed_seconds = time_queries(indexed, queries, args.repeat)
+        print(f"{label:>8}: linear {linear_seconds * 1e6:9.1f} us/query, "
+              f"index {indexed_seconds * 1e6:8.1f} us/query, {linear_seconds / indexed_seconds:6.1f}x faster")
+
+if __name__ == '__main__':
+    main()
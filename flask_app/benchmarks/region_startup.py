@@ -0,0 +1,118 @@
+"""
+Load time and per-worker memory of the region data, old and new layouts.
+
+Each layout is loaded in a fresh interpreter, the way a worker starts:
+
+    dicts    load_all_regions: the list of 91k dicts the app used to build
+    indexed  load_all_regions plus the in-memory RegionIndex
+    mapped   MappedRegionIndex over the compiled data/regions.idx
+
+Memory is read from /proc/self/smaps_rollup before and after loading, and
+again after a batch of lookups and searches has touched the pages. The
+indexed layout builds RegionSearch's trigram index in memory for those
+searches; the mapped layout reads it from the file. Private_Dirty is what
+each worker pays on its own; the mapped file's pages are clean and shared
+through the page cache. Run from the flask_app directory (Linux only):
+
+    python -m models.region_store
+    python benchmarks/region_startup.py
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+FLASK_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FLASK_APP_DIR)
+
+LAYOUTS = ('dicts', 'indexed', 'mapped')
+
+def memory_kb():
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {'rss': fields.get('Rss', 0), 'private_dirty': fields.get('Private_Dirty', 0)}
+
+def run_child(layout, csv_path, index_path, lookups):
+    from models.region_search import RegionSearch
+    from models.region_store import MappedRegionIndex
+    from models.wilayah_lookup import RegionIndex, load_all_regions
+
+    before = memory_kb()
+    start = time.perf_counter()
+    if layout == 'dicts':
+        regions = load_all_regions(csv_path)
+        index = None
+    elif layout == 'indexed':
+        regions = load_all_regions(csv_path)
+        index = RegionIndex(regions)
+    else:
+        index = MappedRegionIndex(index_path)
+    load_seconds = time.perf_counter() - start
+    loaded = memory_kb()
+
+    if index is not None:
+        rng = random.Random(0)
+        for _ in range(lookups):
+            # Walk a random province -> village path, like a user going through the pickers
+            region = rng.choice(index.children())
+            children = index.children(region['kode_wilayah'])
+            while children:
+                region = rng.choice(children)
+                children = index.children(region['kode_wilayah'])
+            index.get(region['kode_wilayah'])
+            index.ancestors(region['kode_wilayah'])
+        for query in ('a', 'ba', 'su', 'kab', 'kota', 'desa', 'xyz'):
+            index.suggest_by_name(query)
+            index.codes_by_name(query)
+        search = RegionSearch(index)
+        for query in ('kota', 'slemn', 'kongan', 'jakarta selatn', 'xyz'):
+            search.search(query)
+    used = memory_kb()
+
+    print(json.dumps({
+        'layout': layout,
+        'load_ms': round(load_seconds * 1000, 2),
+        'rss_delta_kb': loaded['rss'] - before['rss'],
+        'private_dirty_delta_kb': loaded['private_dirty'] - before['private_dirty'],
+        'rss_after_queries_delta_kb': used['rss'] - before['rss'],
+        'private_dirty_after_queries_delta_kb': used['private_dirty'] - before['private_dirty'],
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=os.path.join(FLASK_APP_DIR, 'data', 'base.csv'))
+    parser.add_argument('--index', default=os.path.join(FLASK_APP_DIR, 'data', 'regions.idx'))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--child', choices=LAYOUTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.csv, args.index, args.lookups)
+        return
+
+    if not os.path.exists(args.index):
+        from models.region_store import compile_regions
+        compile_regions(args.csv, args.index)
+
+    for layout in LAYOUTS:
+        results = []
+        for _ in range(args.runs):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', layout,
+                                     '--csv', args.csv, '--index', args.index, '--lookups', str(args.lookups)],
+                                    capture_output=True, text=True, check=True).stdout
+            results.append(json.loads(output))
+        best = min(results, key=lambda result: result['load_ms'])
+        print(f"{layout:>8}: load {best['load_ms']:8.2f} ms, "
+              f"RSS +{best['rss_delta_kb'] / 1024:6.1f} MB (+{best['rss_after_queries_delta_kb'] / 1024:6.1f} MB after lookups), "
+              f"private dirty +{best['private_dirty_after_queries_delta_kb'] / 1024:6.1f} MB")
+
+if __name__ == '__main__':
+    main()
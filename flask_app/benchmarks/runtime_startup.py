@@ -0,0 +1,94 @@
+"""
+Compare cold-start time and resident memory of the TFLite interpreter backends.
+
+Each backend is measured in a fresh interpreter process so import costs are not
+shared. Run from the flask_app directory:
+
+    python benchmarks/runtime_startup.py --model model_cache/Corn.tflite --runs 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+FLASK_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in the child process; prints one JSON line with its measurements
+CHILD_SCRIPT = r'''
+import json, sys, time
+start = time.perf_counter()
+from utils.tflite_model import get_interpreter_backend, create_interpreter
+backend = get_interpreter_backend()
+imported = time.perf_counter()
+model_path = sys.argv[1]
+if model_path:
+    with open(model_path, 'rb') as f:
+        create_interpreter(f.read())
+ready = time.perf_counter()
+
+def rss_bytes():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+print(json.dumps({
+    'backend': backend.name,
+    'import_seconds': imported - start,
+    'ready_seconds': ready - start,
+    'rss_bytes': rss_bytes(),
+}))
+'''
+
+def measure(backend, model_path, runs):
+    samples = []
+    env = dict(os.environ, TFLITE_BACKEND=backend)
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, '-c', CHILD_SCRIPT, model_path or ''],
+            cwd=FLASK_APP_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()
+            return {'backend': backend, 'error': error[-1] if error else 'failed'}
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    def median(key):
+        values = sorted(sample[key] for sample in samples)
+        return values[len(values) // 2]
+
+    return {
+        'backend': backend,
+        'runs': runs,
+        'import_seconds': round(median('import_seconds'), 4),
+        'ready_seconds': round(median('ready_seconds'), 4),
+        'rss_mb': round(median('rss_bytes') / (1024 * 1024), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', help='Optional .tflite file to load after importing the backend')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    results = [measure(backend, args.model, args.runs) for backend in ('tflite_runtime', 'tensorflow')]
+    for result in results:
+        if 'error' in result:
+            print(f"{result['backend']:>15}: unavailable ({result['error']})")
+        else:
+            print(f"{result['backend']:>15}: import {result['import_seconds']:.3f}s, "
+                  f"ready {result['ready_seconds']:.3f}s, RSS {result['rss_mb']:.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Generate small stand-in TFLite models for offline benchmarking.
+
+Each model takes the same (1, 150, 150, 3) float32 input as the real plant
+models and ends in a softmax over that plant's classes from
+utils/class_names.json, so preprocessing, invoke and postprocessing follow
+the production code path without GCS access. Requires tensorflow.
+
+    python benchmarks/synthetic_models.py --output-dir /tmp/tanicare_models
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.tflite_model import load_class_names, model_name_for_plant
+
+INPUT_SHAPE = (150, 150, 3)
+
+def build_model_content(num_classes, seed=0):
+    """Return the bytes of a small conv net converted to TFLite."""
+    import tensorflow as tf
+
+    tf.random.set_seed(seed)
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=INPUT_SHAPE),
+        tf.keras.layers.Conv2D(16, 3, strides=2, activation='relu'),
+        tf.keras.layers.Conv2D(32, 3, strides=2, activation='relu'),
+        tf.keras.layers.Conv2D(64, 3, strides=2, activation='relu'),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(num_classes, activation='softmax'),
+    ])
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    return converter.convert()
+
+def generate_models(output_dir, class_names_path='./utils/class_names.json'):
+    """Write one `<Plant>.tflite` per plant into `output_dir` and return their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for seed, (plant, classes) in enumerate(sorted(load_class_names(class_names_path).items())):
+        path = os.path.join(output_dir, model_name_for_plant(plant))
+        with open(path, 'wb') as f:
+            f.write(build_model_content(len(classes), seed=seed))
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output-dir', required=True)
+    args = parser.parse_args()
+    for path in generate_models(args.output_dir):
+        print(f"Wrote {path}")
+
+if __name__ == '__main__':
+    main()
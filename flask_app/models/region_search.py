@@ -0,0 +1,310 @@
+import array
+import heapq
+import re
+import threading
+from bisect import bisect_left, bisect_right
+
+from .wilayah_lookup import region_level
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+# Match qualities, best first
+EXACT, PREFIX, WORD_PREFIX, INFIX, FUZZY = range(5)
+MATCH_NAMES = ('exact', 'prefix', 'word_prefix', 'infix', 'fuzzy')
+
+def normalize_name(name):
+    # "KAB. ACEH SELATAN" -> "kab aceh selatan"
+    return _NON_ALNUM.sub(' ', name.lower()).strip()
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def substring_distance(pattern, text):
+    """
+    Smallest edit distance between `pattern` and any substring of `text`.
+
+    Myers' bit-parallel algorithm: one column of the edit distance table is
+    held in the bits of a few integers, so each character of `text` costs a
+    handful of integer operations instead of a loop over `pattern`.
+    """
+    length = len(pattern)
+    if length == 0:
+        return 0
+    masks = {}
+    for i, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    full = (1 << length) - 1
+    last = 1 << (length - 1)
+    positive, negative = full, 0
+    score = best = length
+    for char in text:
+        match = masks.get(char, 0)
+        vertical = match | negative
+        horizontal = (((match & positive) + positive) ^ positive) | match
+        horizontal_positive = negative | (~(horizontal | positive) & full)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            score += 1
+        elif horizontal_negative & last:
+            score -= 1
+        # A match may start anywhere in text, so nothing is shifted in at the top row
+        horizontal_positive = (horizontal_positive << 1) & full
+        horizontal_negative = (horizontal_negative << 1) & full
+        positive = horizontal_negative | (~(vertical | horizontal_positive) & full)
+        negative = horizontal_positive & vertical
+        best = min(best, score)
+    return best
+
+def allowed_distance(query_length):
+    if query_length >= 10:
+        return 2
+    if query_length >= 4:
+        return 1
+    return 0
+
+def gram_key(gram):
+    # Normalized names are ASCII, so a trigram packs into one uint32
+    return ord(gram[0]) << 16 | ord(gram[1]) << 8 | ord(gram[2])
+
+def split_pieces(query, max_distance):
+    # k edits touch at most k of k + 1 pieces, so a match contains one piece unchanged
+    count = max_distance + 1
+    bounds = [len(query) * i // count for i in range(count + 1)]
+    return [query[start:end] for start, end in zip(bounds, bounds[1:])]
+
+def build_search_tables(region_index):
+    """
+    Flat search columns for any region index with __len__ and region_at.
+
+    Every column is a uint32 array (levels are bytes in memory) so that
+    compile_regions can write them into the region index file as they are:
+
+        search_name_data       distinct normalized names, each followed by a newline, shortest first
+        search_name_offsets    start of each name in search_name_data, plus the end
+        search_length_starts   first name id of each name length, plus the name count
+        search_gram_keys       sorted trigram keys (see gram_key)
+        search_posting_offsets start of each trigram's name ids in search_postings, plus the end
+        search_postings        name ids containing each trigram, ascending
+        search_row_offsets     start of each name's rows in search_rows, plus the end
+        search_rows            rows carrying each name, in file order
+        search_best_rows       each name's row with the lowest (level, position)
+        region_levels          administrative level of every row
+    """
+    levels = array.array('B')
+    rows_by_name = {}
+    for position in range(len(region_index)):
+        region = region_index.region_at(position)
+        levels.append(region_level(region['kode_wilayah']))
+        rows_by_name.setdefault(normalize_name(region['name']), []).append(position)
+
+    # Shortest names first, so the names long enough for a query are one contiguous run of ids
+    names = sorted(rows_by_name, key=lambda name: (len(name), rows_by_name[name][0]))
+    name_offsets = array.array('I', [0])
+    length_starts = array.array('I')
+    row_offsets = array.array('I', [0])
+    rows = array.array('I')
+    best_rows = array.array('I')
+    postings = {}
+    for name_id, name in enumerate(names):
+        while len(length_starts) <= len(name):
+            length_starts.append(name_id)
+        name_offsets.append(name_offsets[-1] + len(name) + 1)
+        name_rows = rows_by_name[name]
+        rows.extend(name_rows)
+        row_offsets.append(len(rows))
+        best_rows.append(min(name_rows, key=lambda position: (levels[position], position)))
+        # Pad with spaces so word starts and ends get their own trigrams
+        for gram in trigrams(f' {name} '):
+            postings.setdefault(gram_key(gram), array.array('I')).append(name_id)
+    length_starts.append(len(names))
+
+    gram_keys = array.array('I', sorted(postings))
+    posting_offsets = array.array('I', [0])
+    posting_data = array.array('I')
+    for key in gram_keys:
+        posting_data.extend(postings[key])
+        posting_offsets.append(len(posting_data))
+
+    return {
+        'search_name_data': ''.join(f'{name}\n' for name in names).encode('ascii'),
+        'search_name_offsets': name_offsets,
+        'search_length_starts': length_starts,
+        'search_gram_keys': gram_keys,
+        'search_posting_offsets': posting_offsets,
+        'search_postings': posting_data,
+        'search_row_offsets': row_offsets,
+        'search_rows': rows,
+        'search_best_rows': best_rows,
+        'region_levels': levels,
+    }
+
+
+class RegionSearch:
+    """
+    Infix and typo-tolerant region search over a trigram inverted index.
+
+    Distinct normalized names are indexed once (many villages share a name),
+    with a posting list of name ids per trigram. A query with edit budget k
+    must keep all but 3k of its trigrams, so candidates come from the 3k + 1
+    rarest posting lists. Candidates that cannot reach that count are
+    dropped, and the rest are verified by substring edit distance. Queries
+    too short to keep two trigrams through their edits (4 to 6 characters)
+    instead scan the names long enough to match, bucketed by length, that
+    contain one of k + 1 query pieces unchanged. Results
+    are ranked by match quality, distance, administrative level, name length
+    and file order.
+
+    A MappedRegionIndex carries the index in its file (see
+    build_search_tables), so it is ready at once and its pages are shared by
+    every worker. Any other region index with __len__ and region_at is
+    indexed in memory, by build() (meant for a background thread at startup)
+    or else by the first search. Searches wait while a build is running.
+    """
+
+    # Posting lists longer than this are assumed to match when counting, instead of being scanned
+    COUNT_LIST_LIMIT = 20000
+
+    def __init__(self, region_index):
+        self.region_index = region_index
+        self._lock = threading.Lock()
+        self._built = False
+        # Results of one- and two-character queries, which match most names and are few in number
+        self._short_results = {}
+        search_tables = getattr(region_index, 'search_tables', None)
+        if search_tables is not None:
+            self._load(search_tables())
+
+    def _load(self, tables):
+        # Only the names are copied out of a mapped file; every other column is used in place
+        self._name_data = str(tables['search_name_data'], 'ascii')
+        self._name_offsets = tables['search_name_offsets']
+        self._length_starts = tables['search_length_starts']
+        self._gram_keys = tables['search_gram_keys']
+        self._posting_offsets = tables['search_posting_offsets']
+        self._postings = tables['search_postings']
+        self._row_offsets = tables['search_row_offsets']
+        self._rows = tables['search_rows']
+        self._best_rows = tables['search_best_rows']
+        self._levels = tables['region_levels']
+        self._built = True
+
+    @property
+    def built(self):
+        return self._built
+
+    def build(self):
+        """Build the index now unless it already exists."""
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._load(build_search_tables(self.region_index))
+
+    def _name(self, name_id):
+        return self._name_data[self._name_offsets[name_id]:self._name_offsets[name_id + 1] - 1]
+
+    def _posting(self, gram):
+        key = gram_key(gram)
+        slot = bisect_left(self._gram_keys, key)
+        if slot == len(self._gram_keys) or self._gram_keys[slot] != key:
+            return ()
+        return self._postings[self._posting_offsets[slot]:self._posting_offsets[slot + 1]]
+
+    def _candidates(self, query, max_distance):
+        postings = sorted((self._posting(gram) for gram in trigrams(query)), key=len)
+        needed = len(postings) - 3 * max_distance
+        counts = {}
+        for posting in postings[:3 * max_distance + 1]:
+            for name_id in posting:
+                counts[name_id] = counts.get(name_id, 0) + 1
+
+        assumed = 0
+        for posting in postings[3 * max_distance + 1:]:
+            if len(posting) > self.COUNT_LIST_LIMIT:
+                assumed += 1
+                continue
+            for name_id in posting:
+                if name_id in counts:
+                    counts[name_id] += 1
+        return [name_id for name_id, count in counts.items() if count + assumed >= needed]
+
+    def _scan_candidates(self, query, max_distance):
+        # A substring within k edits of the query is at least len(query) - k characters long
+        first = self._length_starts[min(max(0, len(query) - max_distance), len(self._length_starts) - 1)]
+        start = self._name_offsets[first]
+        name_ids = set()
+        for piece in split_pieces(query, max_distance):
+            found = self._name_data.find(piece, start)
+            while found != -1:
+                name_id = bisect_right(self._name_offsets, found) - 1
+                name_ids.add(name_id)
+                # Skip to the next name; one hit per name is enough
+                found = self._name_data.find(piece, self._name_offsets[name_id + 1])
+        return name_ids
+
+    def _classify(self, query, name, max_distance):
+        # Returns (quality, distance), or None when the name does not match
+        if name == query:
+            return EXACT, 0
+        if name.startswith(query):
+            return PREFIX, 0
+        if f' {query}' in f' {name}':
+            return WORD_PREFIX, 0
+        if query in name:
+            return INFIX, 0
+        if max_distance:
+            distance = substring_distance(query, name)
+            if distance <= max_distance:
+                return FUZZY, distance
+        return None
+
+    def search(self, query, limit=10, max_distance=None):
+        """
+        Regions whose name contains the query, allowing up to `max_distance` edits
+        (by default as many as the query length supports, at most 2).
+        """
+        self.build()
+        query = normalize_name(query)
+        if not query:
+            return []
+        budget = allowed_distance(len(query))
+        max_distance = budget if max_distance is None else max(0, min(max_distance, budget))
+
+        if len(query) < 3:
+            cached = self._short_results.get((query, limit))
+            if cached is not None:
+                return cached
+            # Too short for trigrams; scan the distinct names instead
+            name_ids = self._scan_candidates(query, 0)
+        elif max_distance and len(trigrams(query)) - 3 * max_distance < 2:
+            name_ids = self._scan_candidates(query, max_distance)
+        else:
+            name_ids = self._candidates(query, max_distance)
+
+        matches = []
+        for name_id in name_ids:
+            name = self._name(name_id)
+            match = self._classify(query, name, max_distance)
+            if match is not None:
+                best_row = self._best_rows[name_id]
+                matches.append((match[0], match[1], self._levels[best_row], best_row, len(name), name_id))
+
+        # A name's rows all rank after its best row, so the top rows come from the top names
+        ranked = []
+        for quality, distance, _, _, name_length, name_id in heapq.nsmallest(
+                limit, matches, key=lambda match: (match[0], match[1], match[2], match[4], match[3])):
+            ranked.extend((quality, distance, self._levels[position], name_length, position)
+                          for position in self._rows[self._row_offsets[name_id]:self._row_offsets[name_id + 1]])
+
+        results = []
+        for quality, distance, level, _, position in heapq.nsmallest(limit, ranked):
+            region = self.region_index.region_at(position)
+            results.append({
+                'kode_wilayah': region['kode_wilayah'],
+                'name': region['name'],
+                'level': level,
+                'match': MATCH_NAMES[quality],
+                'distance': distance,
+            })
+        if len(query) < 3:
+            self._short_results[(query, limit)] = results
+        return results
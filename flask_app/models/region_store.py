@@ -0,0 +1,272 @@
+import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+
+from .region_search import build_search_tables
+from .wilayah_lookup import RegionIndex, load_all_regions, parent_code
+
+MAGIC = b'TCRI'
+# 2: trigram search columns
+FORMAT_VERSION = 2
+
+# Sections of the index file, each a little-endian uint32 array except the byte sections
+SECTIONS = (
+    'string_offsets',    # start of every interned string in string_data, plus the end
+    'string_data',       # UTF-8 bytes of all distinct codes, names and lowercased names
+    'codes',             # string id of each row's kode_wilayah, in base.csv order
+    'names',             # string id of each row's name
+    'sorted_positions',  # rows ordered by lowercased name
+    'sorted_keys',       # string id of the lowercased name at each sorted slot
+    'child_offsets',     # start of each row's children in child_rows; slot `rows` holds the provinces
+    'child_rows',        # children of every row, in file order
+    'code_table',        # open-addressing hash table of row + 1 (0 is empty), keyed by kode_wilayah
+    # RegionSearch's columns, described in build_search_tables
+    'search_name_data',
+    'search_name_offsets',
+    'search_length_starts',
+    'search_gram_keys',
+    'search_posting_offsets',
+    'search_postings',
+    'search_row_offsets',
+    'search_rows',
+    'search_best_rows',
+    'region_levels',
+)
+SEARCH_SECTIONS = SECTIONS[SECTIONS.index('search_name_data'):]
+_BYTE_SECTIONS = ('string_data', 'search_name_data')
+_HEADER = struct.Struct('<4sIIII32s' + 'QQ' * len(SECTIONS))
+_ALIGN = 8
+
+
+def _fnv1a(data):
+    value = 0x811c9dc5
+    for byte in data:
+        value = ((value ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return value
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+def _uint32_array(values):
+    data = array.array('I', values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+def compile_regions(csv_path, output_path):
+    """Compile base.csv into the binary index read by MappedRegionIndex; returns the row count."""
+    regions = load_all_regions(csv_path)
+    rows = len(regions)
+
+    string_ids = {}
+    string_data = bytearray()
+    string_offsets = [0]
+
+    def intern(text):
+        string_id = string_ids.get(text)
+        if string_id is None:
+            string_id = string_ids[text] = len(string_offsets) - 1
+            string_data.extend(text.encode('utf-8'))
+            string_offsets.append(len(string_data))
+        return string_id
+
+    codes = [intern(region['kode_wilayah']) for region in regions]
+    names = [intern(region['name']) for region in regions]
+    # Sorting str and comparing UTF-8 bytes agree, so the loader can bisect raw bytes
+    sorted_positions = sorted(range(rows), key=lambda position: regions[position]['name'].lower())
+    sorted_keys = [intern(regions[position]['name'].lower()) for position in sorted_positions]
+
+    positions_by_code = {region['kode_wilayah']: position for position, region in enumerate(regions)}
+    children = [[] for _ in range(rows + 1)]
+    for position, region in enumerate(regions):
+        code = parent_code(region['kode_wilayah'])
+        parent = rows if code is None else positions_by_code.get(code)
+        if parent is not None:
+            children[parent].append(position)
+    child_offsets = [0]
+    child_rows = []
+    for row_children in children:
+        child_rows.extend(row_children)
+        child_offsets.append(len(child_rows))
+
+    table_size = 1
+    while table_size < rows * 2:
+        table_size *= 2
+    code_table = [0] * table_size
+    for code, position in positions_by_code.items():
+        slot = _fnv1a(code.encode('utf-8')) & (table_size - 1)
+        while code_table[slot]:
+            slot = (slot + 1) & (table_size - 1)
+        code_table[slot] = position + 1
+
+    sections = {
+        'string_offsets': _uint32_array(string_offsets),
+        'string_data': bytes(string_data),
+        'codes': _uint32_array(codes),
+        'names': _uint32_array(names),
+        'sorted_positions': _uint32_array(sorted_positions),
+        'sorted_keys': _uint32_array(sorted_keys),
+        'child_offsets': _uint32_array(child_offsets),
+        'child_rows': _uint32_array(child_rows),
+        'code_table': _uint32_array(code_table),
+    }
+    for name, column in build_search_tables(RegionIndex(regions)).items():
+        sections[name] = column if name in _BYTE_SECTIONS else _uint32_array(column)
+
+    body = bytearray()
+    locations = []
+    for name in SECTIONS:
+        offset = _HEADER.size + len(body)
+        padding = -offset % _ALIGN
+        body.extend(b'\0' * padding)
+        locations += [offset + padding, len(sections[name])]
+        body.extend(sections[name])
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, rows, len(string_offsets) - 1, table_size,
+                          file_sha256(csv_path), *locations)
+    # Write next to the target and rename, so running workers never map a half-written file
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+    os.replace(temp_path, output_path)
+    return rows
+
+
+class _SortedKeys:
+    """Sequence view of the lowercased names in sorted order, as UTF-8 bytes, for bisect."""
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, slot):
+        return self._index._string_bytes(self._index._sorted_keys[slot])
+
+
+class MappedRegionIndex(RegionIndex):
+    """
+    RegionIndex backed by a memory-mapped file built with compile_regions.
+
+    Rows, interned strings, the sorted name order, the code tree and a code
+    hash table are flat uint32 columns in one read-only mapping, along with
+    the trigram search index RegionSearch would otherwise build. Loading
+    parses nothing, and the pages live in the OS page cache, where every
+    worker process shares them. Region dicts are only built for the rows a
+    query returns. The queries themselves are inherited from RegionIndex.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if sys.byteorder != 'little':
+            raise ValueError("Region index files are little-endian")
+        fields = _HEADER.unpack_from(self._mmap)
+        magic, version, self._rows, _, self._table_size, self.source_sha256 = fields[:6]
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} region index")
+
+        view = memoryview(self._mmap)
+        locations = fields[6:]
+        sections = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = locations[2 * i], locations[2 * i + 1]
+            section = view[offset:offset + length]
+            sections[name] = section if name in _BYTE_SECTIONS else section.cast('I')
+
+        self._string_offsets = sections['string_offsets']
+        self._string_data = sections['string_data']
+        self._codes = sections['codes']
+        self._names = sections['names']
+        self._sorted_positions = sections['sorted_positions']
+        self._sorted_keys = sections['sorted_keys']
+        self._child_offsets = sections['child_offsets']
+        self._child_rows = sections['child_rows']
+        self._code_table = sections['code_table']
+        self._sorted_key_view = _SortedKeys(self)
+        self._search_tables = {name: sections[name] for name in SEARCH_SECTIONS}
+
+    def __len__(self):
+        return self._rows
+
+    def search_tables(self):
+        """RegionSearch's trigram index, mapped from the file instead of built."""
+        return self._search_tables
+
+    def _string_bytes(self, string_id):
+        return bytes(self._string_data[self._string_offsets[string_id]:self._string_offsets[string_id + 1]])
+
+    def _string(self, string_id):
+        return self._string_bytes(string_id).decode('utf-8')
+
+    def region_at(self, position):
+        return {'kode_wilayah': self._string(self._codes[position]), 'name': self._string(self._names[position])}
+
+    def _position(self, kode_wilayah):
+        code = kode_wilayah.encode('utf-8')
+        mask = self._table_size - 1
+        slot = _fnv1a(code) & mask
+        while True:
+            entry = self._code_table[slot]
+            if entry == 0:
+                return None
+            if self._string_bytes(self._codes[entry - 1]) == code:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def _prefix_range(self, query):
+        prefix = query.lower().encode('utf-8')
+        start = bisect_left(self._sorted_key_view, prefix)
+        # 0xff never occurs in UTF-8, so it sorts after every name starting with the prefix
+        end = bisect_left(self._sorted_key_view, prefix + b'\xff', start)
+        return start, end
+
+    def get(self, kode_wilayah):
+        position = self._position(kode_wilayah)
+        return self.region_at(position) if position is not None else None
+
+    def children(self, kode_wilayah=None):
+        position = self._rows if kode_wilayah is None else self._position(kode_wilayah)
+        if position is None:
+            return []
+        start, end = self._child_offsets[position], self._child_offsets[position + 1]
+        return [self.region_at(child) for child in self._child_rows[start:end]]
+
+
+def load_region_index(csv_path, index_path):
+    """
+    Memory-map the compiled index when it was built from this exact CSV;
+    otherwise parse the CSV into an in-memory RegionIndex.
+    """
+    source_sha256 = file_sha256(csv_path)
+    if index_path and os.path.exists(index_path):
+        try:
+            index = MappedRegionIndex(index_path)
+            if index.source_sha256 == source_sha256:
+                return index
+            print(f"{index_path} was built from a different {csv_path}; rebuild it with "
+                  f"python -m models.region_store")
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Could not load region index {index_path}: {e}")
+    return RegionIndex(load_all_regions(csv_path), source_sha256=source_sha256)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile base.csv into a memory-mappable region index.")
+    parser.add_argument('csv', nargs='?', default='data/base.csv')
+    parser.add_argument('output', nargs='?', default='data/regions.idx')
+    args = parser.parse_args()
+    count = compile_regions(args.csv, args.output)
+    print(f"Wrote {count} regions to {args.output} ({os.path.getsize(args.output)} bytes)")
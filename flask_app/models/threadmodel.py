@@ -1,11 +1,25 @@
+import base64
+import binascii
+import json
+import os
+import random
+from datetime import datetime
 from firebase_admin import firestore
-from .userModel import get_user_by_uid
+from .userModel import get_cached_user, get_users_by_uids
 import uuid
 
 db = firestore.client()
 
+def attach_thread_owner(thread, user):
+    """Fill in the owner's name and photo on a thread from their user document."""
+    user = user or {}
+    thread['username'] = user.get('name')
+    thread['photoProfileUrl'] = user.get('profile_photo')
+    thread['photoProfileDerivatives'] = user.get('profile_photo_derivatives')
+    return thread
+
 # Threads
-def save_thread_to_firestore(thread_id, body, owner_id, created_at, photo_url=None):
+def save_thread_to_firestore(thread_id, body, owner_id, created_at, photo_url=None, photo_derivatives=None):
     """Save a thread to Firestore."""
     thread_data = {
         'id': thread_id,
@@ -15,34 +29,84 @@ def save_thread_to_firestore(thread_id, body, owner_id, created_at, photo_url=No
         'upVotes': 0,
         'totalComments': 0,
         'photoUrl': photo_url,
+        'photoDerivatives': photo_derivatives,
     }
     db.collection('threads').document(thread_id).set(thread_data)
     return thread_data
 
-def get_all_threads(limit=10, page=1):
+def mark_thread_photo_pending(thread_id):
+    """Flag a thread whose photo upload failed, so clients know the photo is not there yet."""
+    db.collection('threads').document(thread_id).update({'photoStatus': 'pending'})
+
+def set_thread_photo_derivatives(thread_id, derivatives):
+    """Record the resized photo URLs of a thread once they have all been uploaded."""
+    db.collection('threads').document(thread_id).update({'photoDerivatives': derivatives})
+
+def encode_thread_cursor(thread):
+    """Opaque token for the position right after `thread` in the feed."""
+    payload = json.dumps({'createdAt': thread['createdAt'].isoformat(), 'id': thread['id']})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_thread_cursor(cursor):
+    """Inverse of encode_thread_cursor; raises ValueError for anything it did not produce."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return datetime.fromisoformat(payload['createdAt']), payload['id']
+    except (TypeError, KeyError, UnicodeDecodeError, binascii.Error, json.JSONDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def get_threads_page(limit=10, page=None, cursor=None):
     """
-    Fetch all threads from Firestore with pagination.
+    Fetch one page of the feed, newest first, and the cursor for the next page
+    (None on the last page).
+
+    With a cursor the query starts right after the (createdAt, id) it encodes,
+    so Firestore only reads the documents it returns. `page` still works but
+    pays for every skipped document; it is kept for clients that have not
+    moved to cursors yet. The document ID breaks ties between threads created
+    in the same instant, so none are skipped or repeated; Firestore already
+    orders by it after createdAt, so the single-field index is enough.
     """
-    threads_ref = db.collection('threads').order_by('createdAt', direction=firestore.Query.DESCENDING).limit(limit).offset((page - 1) * limit).stream()
-    threads = [doc.to_dict() for doc in threads_ref]
+    threads_ref = db.collection('threads')
+    query = (threads_ref
+             .order_by('createdAt', direction=firestore.Query.DESCENDING)
+             .order_by(firestore.FieldPath.document_id(), direction=firestore.Query.DESCENDING))
+    if cursor:
+        created_at, thread_id = decode_thread_cursor(cursor)
+        query = query.start_after({'createdAt': created_at,
+                                   firestore.FieldPath.document_id(): threads_ref.document(thread_id)})
+    elif page and page > 1:
+        query = query.offset((page - 1) * limit)
 
-    # Fetch user details for each thread
+    # One extra document tells whether there is a next page
+    threads = [doc.to_dict() for doc in query.limit(limit + 1).stream()]
+    next_cursor = None
+    if len(threads) > limit:
+        threads = threads[:limit]
+        next_cursor = encode_thread_cursor(threads[-1])
+
+    resolve_upvote_counts(threads)
+
+    # Fetch user details for all thread owners in one batch
+    users = get_users_by_uids(thread['ownerId'] for thread in threads)
     for thread in threads:
-        user = get_user_by_uid(thread['ownerId'])
-        thread['username'] = user.get('name')
-        thread['photoProfileUrl'] = user.get('profile_photo')
+        attach_thread_owner(thread, users.get(thread['ownerId']))
 
+    return threads, next_cursor
+
+def get_all_threads(limit=10, page=1):
+    """
+    Fetch all threads from Firestore with pagination.
+    """
+    threads, _ = get_threads_page(limit=limit, page=page)
     return threads
 
 def get_thread_by_id(thread_id):
     """Retrieve a specific thread by its ID."""
     doc = db.collection('threads').document(thread_id).get()
     if doc.exists:
-        thread = doc.to_dict()
-        user = get_user_by_uid(thread['ownerId'])
-        thread['username'] = user.get('name')
-        thread['photoProfileUrl'] = user.get('profile_photo')
-        return thread
+        thread = resolve_upvote_counts([doc.to_dict()])[0]
+        return attach_thread_owner(thread, get_cached_user(thread['ownerId']))
     return None
 
 def count_upvotes_by_thread_id(thread_id):
@@ -68,7 +132,7 @@ def save_comment_to_firestore(thread_id, content, owner, created_at):
     thread_ref.update({'totalComments': firestore.Increment(1)})
 
     # Fetch user details for the owner
-    user = get_user_by_uid(owner['id'])
+    user = get_cached_user(owner['id']) or {}
     comment_data['owner']['photoProfileUrl'] = user.get('profile_photo')
 
     # Retrieve saved comment with resolved timestamp
@@ -80,48 +144,129 @@ def save_comment_to_firestore(thread_id, content, owner, created_at):
 def get_comments_by_thread_id(thread_id):
     """Retrieve all comments for a specific thread and include owner details."""
     comments_ref = db.collection('comments').where('threadId', '==', thread_id).stream()
-    comments = []
-    for doc in comments_ref:
-        comment = doc.to_dict()
-        user = get_user_by_uid(comment['owner']['id'])
+    comments = [doc.to_dict() for doc in comments_ref]
+
+    # Fetch every distinct commenter once, in a single batch
+    users = get_users_by_uids(comment['owner']['id'] for comment in comments)
+    for comment in comments:
+        user = users.get(comment['owner']['id'], {})
         comment['owner']['photoProfileUrl'] = user.get('profile_photo')
-        comments.append(comment)
     return comments
 
 # Upvotes
+# Opt-in sharded counters: a thread with `upvoteShards` set counts new votes in that many shard
+# documents instead of its own upVotes field, so votes stop contending on one document.
+# Threads reaching UPVOTE_SHARD_THRESHOLD votes are switched over automatically; 0 turns that off.
+UPVOTE_SHARDS = int(os.environ.get('UPVOTE_SHARDS', 10))
+UPVOTE_SHARD_THRESHOLD = int(os.environ.get('UPVOTE_SHARD_THRESHOLD', 0))
+# Votes saved before upvotes got deterministic IDs are found with the old query until
+# migrate_legacy_upvotes has run; set UPVOTE_LEGACY_LOOKUP=0 after that to save the query
+UPVOTE_LEGACY_LOOKUP = os.environ.get('UPVOTE_LEGACY_LOOKUP', '1') == '1'
+
+def upvote_doc_id(thread_id, user_id):
+    """Each user can upvote a thread once, so the pair is the document ID."""
+    return f"{thread_id}_{user_id}"
+
+def find_upvote(thread_id, user_id, snapshot, transaction=None):
+    """
+    The user's vote on a thread: `snapshot` of its {threadId}_{userId} document,
+    or, while UPVOTE_LEGACY_LOOKUP is on, a vote saved under a random ID.
+    """
+    if snapshot.exists or not UPVOTE_LEGACY_LOOKUP:
+        return snapshot
+    query = db.collection('upvotes') \
+        .where('threadId', '==', thread_id) \
+        .where('userId', '==', user_id) \
+        .limit(1)
+    legacy = list(transaction.get(query) if transaction is not None else query.stream())
+    return legacy[0] if legacy else snapshot
+
+def upvote_shard_ref(thread_id, shard):
+    return db.collection('threads').document(thread_id).collection('upvoteShards').document(str(shard))
+
+def upvote_counter_update(transaction, thread_ref, thread_data, delta):
+    """Add `delta` to a thread's upvote count, on a random shard if the thread is sharded."""
+    shards = thread_data.get('upvoteShards')
+    if shards:
+        shard_ref = upvote_shard_ref(thread_ref.id, random.randrange(shards))
+        transaction.set(shard_ref, {'count': firestore.Increment(delta)}, merge=True)
+    else:
+        transaction.update(thread_ref, {'upVotes': firestore.Increment(delta)})
+
+def resolve_upvote_counts(threads):
+    """
+    Fill in the real upVotes of sharded threads: the thread's own field (votes from
+    before sharding) plus every shard. All shards of all threads are read in one get_all.
+    """
+    sharded = [thread for thread in threads if thread.get('upvoteShards')]
+    if not sharded:
+        return threads
+
+    refs = [upvote_shard_ref(thread['id'], shard)
+            for thread in sharded for shard in range(thread['upvoteShards'])]
+    counts = {}
+    for doc in db.get_all(refs):
+        if doc.exists:
+            thread_id = doc.reference.parent.parent.id
+            counts[thread_id] = counts.get(thread_id, 0) + doc.to_dict().get('count', 0)
+    for thread in sharded:
+        thread['upVotes'] = max(thread.get('upVotes', 0) + counts.get(thread['id'], 0), 0)
+    return threads
+
+def enable_upvote_shards(thread_id, shards=UPVOTE_SHARDS):
+    """Switch a thread to sharded upvote counting. The shard count can only grow."""
+    thread_ref = db.collection('threads').document(thread_id)
+
+    @firestore.transactional
+    def enable(transaction):
+        thread = thread_ref.get(transaction=transaction)
+        if not thread.exists:
+            raise ValueError("Thread not found")
+        current = thread.to_dict().get('upvoteShards') or 0
+        if shards > current:
+            transaction.update(thread_ref, {'upvoteShards': shards})
+        return max(shards, current)
+
+    return enable(db.transaction())
+
 def save_upvote_to_firestore(thread_id, user_id):
     """Save an upvote to Firestore and update the thread's upvote count."""
-    # Check if the user has already upvoted the thread
-    if check_if_user_upvoted(thread_id, user_id):
-        raise ValueError("User has already upvoted this thread")
-
     thread_ref = db.collection('threads').document(thread_id)
-    thread = thread_ref.get()
-    if not thread.exists:
-        raise ValueError("Thread not found")
+    upvote_ref = db.collection('upvotes').document(upvote_doc_id(thread_id, user_id))
 
-    thread_data = thread.to_dict()
-    upvotes = thread_data.get('upVotes', 0) + 1
+    # The vote and the count change commit together, and a retry re-checks the vote
+    @firestore.transactional
+    def upvote(transaction):
+        docs = {doc.id: doc for doc in transaction.get_all([upvote_ref, thread_ref])}
+        thread = docs[thread_ref.id]
+        if not thread.exists:
+            raise ValueError("Thread not found")
+        if find_upvote(thread_id, user_id, docs[upvote_ref.id], transaction).exists:
+            raise ValueError("User has already upvoted this thread")
 
-    # Save the upvote
-    upvote_data = {
-        'threadId': thread_id,
-        'userId': user_id,
-        'voteType': 1  # 1 for upvote
-    }
-    db.collection('upvotes').add(upvote_data)
+        thread_data = thread.to_dict()
+        transaction.create(upvote_ref, {
+            'threadId': thread_id,
+            'userId': user_id,
+            'voteType': 1  # 1 for upvote
+        })
+        upvote_counter_update(transaction, thread_ref, thread_data, 1)
+        return thread_data
 
-    # Update the upvote count in the thread document
-    thread_ref.update({'upVotes': upvotes})
+    thread_data = upvote(db.transaction())
+    if thread_data.get('upvoteShards'):
+        # Shards are read after the commit, so they already include this vote
+        return resolve_upvote_counts([thread_data])[0]['upVotes']
+
+    upvotes = thread_data.get('upVotes', 0) + 1
+    if UPVOTE_SHARD_THRESHOLD and upvotes >= UPVOTE_SHARD_THRESHOLD:
+        enable_upvote_shards(thread_id)
     return upvotes
 
 def check_if_user_upvoted(thread_id, user_id):
     """Check if a user has already upvoted a thread."""
-    upvote_query = db.collection('upvotes') \
-        .where('threadId', '==', thread_id) \
-        .where('userId', '==', user_id) \
-        .stream()
-    return any(upvote_query)
+    snapshot = db.collection('upvotes').document(upvote_doc_id(thread_id, user_id)).get()
+    return find_upvote(thread_id, user_id, snapshot).exists
 
 def get_upvotes_by_thread_id(thread_id):
     """Retrieve all upvotes for a specific thread."""
@@ -132,40 +277,79 @@ def get_upvotes_by_thread_id(thread_id):
 
 def remove_upvote_from_firestore(thread_id, user_id):
     """Remove an upvote from Firestore and update the thread's upvote count."""
-    # Find the upvote document
-    upvote_query = db.collection('upvotes') \
-        .where('threadId', '==', thread_id) \
-        .where('userId', '==', user_id) \
-        .limit(1) \
-        .stream()
+    thread_ref = db.collection('threads').document(thread_id)
+    upvote_ref = db.collection('upvotes').document(upvote_doc_id(thread_id, user_id))
 
-    upvote_docs = list(upvote_query)
-    if not upvote_docs:
-        raise ValueError("Upvote not found")
+    @firestore.transactional
+    def remove(transaction):
+        docs = {doc.id: doc for doc in transaction.get_all([upvote_ref, thread_ref])}
+        upvote = find_upvote(thread_id, user_id, docs[upvote_ref.id], transaction)
+        if not upvote.exists:
+            raise ValueError("Upvote not found")
+        thread = docs[thread_ref.id]
+        if not thread.exists:
+            raise ValueError("Thread not found")
 
-    # Delete the upvote document
-    upvote_doc = upvote_docs[0]
-    db.collection('upvotes').document(upvote_doc.id).delete()
+        thread_data = thread.to_dict()
+        transaction.delete(upvote.reference)
+        upvote_counter_update(transaction, thread_ref, thread_data, -1)
+        return thread_data
 
-    # Decrement the upvote count in the thread document
-    thread_ref = db.collection('threads').document(thread_id)
-    thread = thread_ref.get()
-    if not thread.exists:
-        raise ValueError("Thread not found")
+    thread_data = remove(db.transaction())
+    if thread_data.get('upvoteShards'):
+        return resolve_upvote_counts([thread_data])[0]['upVotes']
+    return max(thread_data.get('upVotes', 0) - 1, 0)
 
-    thread_data = thread.to_dict()
-    upvotes = thread_data.get('upVotes', 0) - 1
-    if upvotes < 0:
-        upvotes = 0
+def migrate_legacy_upvotes(batch_size=400):
+    """
+    Move upvotes saved under random IDs to their {threadId}_{userId} ID, delete
+    duplicate votes, and recount every thread's upVotes from the votes that
+    are left. Duplicates came from concurrent votes that usually wrote the
+    same count, so the stored counts cannot simply be decremented. Sharded
+    threads get the recount as their base and their shards reset.
 
-    thread_ref.update({'upVotes': upvotes})
-    return upvotes
+    Run it once as part of the deploy that introduces deterministic IDs,
+    ideally while votes are paused, then set UPVOTE_LEGACY_LOOKUP=0:
 
-def check_if_user_upvoted(thread_id, user_id):
-    """Check if a user has already upvoted a thread."""
-    upvote_query = db.collection('upvotes') \
-        .where('threadId', '==', thread_id) \
-        .where('userId', '==', user_id) \
-        .limit(1) \
-        .stream()
-    return any(upvote_query)
+        python -c "import auth.firebase_auth; from models.threadmodel import migrate_legacy_upvotes; print(migrate_legacy_upvotes())"
+
+    Returns (moved, duplicates_removed, threads_recounted).
+    """
+    votes = {}
+    for doc in db.collection('upvotes').stream():
+        upvote = doc.to_dict()
+        votes.setdefault(upvote_doc_id(upvote['threadId'], upvote['userId']), []).append(doc)
+
+    writes = []
+    moved = duplicates = 0
+    counts = {}
+    for doc_id, docs in votes.items():
+        kept = next((doc for doc in docs if doc.id == doc_id), None)
+        if kept is None:
+            kept = docs[0]
+            writes.append(('set', db.collection('upvotes').document(doc_id), kept.to_dict()))
+            moved += 1
+        for doc in docs:
+            if doc.id != doc_id:
+                writes.append(('delete', doc.reference))
+        duplicates += len(docs) - 1
+        thread_id = kept.to_dict()['threadId']
+        counts[thread_id] = counts.get(thread_id, 0) + 1
+
+    # Only threads that still exist are recounted; an update on a deleted one would fail the batch
+    recounted = 0
+    for thread in db.collection('threads').stream():
+        thread_data = thread.to_dict()
+        count = counts.get(thread.id, 0)
+        shards = thread_data.get('upvoteShards') or 0
+        if thread_data.get('upVotes') != count or shards:
+            writes.append(('update', thread.reference, {'upVotes': count}))
+            writes.extend(('delete', upvote_shard_ref(thread.id, shard)) for shard in range(shards))
+            recounted += 1
+
+    for start in range(0, len(writes), batch_size):
+        batch = db.batch()
+        for method, *args in writes[start:start + batch_size]:
+            getattr(batch, method)(*args)
+        batch.commit()
+    return moved, duplicates, recounted
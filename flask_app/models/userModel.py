@@ -1,7 +1,15 @@
+import os
 from firebase_admin import firestore
+from utils.result_cache import ResultCache
 
 db = firestore.client()
 
+# Short-lived copies of user documents for feeds and comments, which only need names and photos
+USER_CACHE = ResultCache(
+    max_entries=int(os.environ.get('USER_CACHE_SIZE', 4096)),
+    ttl_seconds=float(os.environ.get('USER_CACHE_TTL', 30)),
+)
+
 def save_user_to_firestore(uid, email, name, location=None):
 #Save user details to Firestore, including location."""
     user_data = {
@@ -20,10 +28,56 @@ def get_user_by_uid(uid):
     else:
         return None
 
-def save_user_photo(uid, photo_url):
+def get_users_by_uids(uids):
+    # Resolve many users at once: cached ones from memory, the rest in a single get_all round trip.
+    # Returns {uid: user}; unknown uids are left out. Treat the returned dicts as read-only.
+    users = {}
+    missing = []
+    for uid in set(uids):
+        user = USER_CACHE.get(uid)
+        if user is not None:
+            users[uid] = user
+        else:
+            missing.append(uid)
+
+    if missing:
+        refs = [db.collection('users').document(uid) for uid in missing]
+        for doc in db.get_all(refs):
+            if doc.exists:
+                user = doc.to_dict()
+                users[doc.id] = user
+                USER_CACHE.set(doc.id, user)
+    return users
+
+def get_cached_user(uid):
+    # Same as get_user_by_uid, but may be up to USER_CACHE_TTL seconds old
+    return get_users_by_uids([uid]).get(uid)
+
+def invalidate_cached_user(uid):
+    # Call after changing a user's document so feeds pick up the change right away
+    USER_CACHE.delete(uid)
+
+def save_user_photo(uid, photo_url, derivatives=None):
+
+    user_ref = db.collection('users').document(uid)
+    user_ref.update({
+        'profile_photo': photo_url,
+        'profile_photo_derivatives': derivatives  # Resized copies keyed by size, if any
+    })
+    invalidate_cached_user(uid)
 
+def mark_profile_photo_pending(uid):
+    # Flag a profile photo whose upload failed, so clients know it is not there yet
     user_ref = db.collection('users').document(uid)
-    user_ref.update({'profile_photo': photo_url})
+    user_ref.update({'profile_photo_status': 'pending'})
+
+def save_profile_photo_derivatives(uid, photo_url, derivatives):
+    # Record resized URLs once they are uploaded, unless the user has already switched to another photo
+    user_ref = db.collection('users').document(uid)
+    doc = user_ref.get()
+    if doc.exists and doc.to_dict().get('profile_photo') == photo_url:
+        user_ref.update({'profile_photo_derivatives': derivatives})
+        invalidate_cached_user(uid)
 
 def get_user_profile(uid):
 
@@ -40,6 +94,7 @@ def update_user_location(uid, kode_wilayah, region_name):
         'location': kode_wilayah,
         'region_name': region_name  # Save readable region name
     })
+    invalidate_cached_user(uid)
 
 def add_created_thread_to_user(uid, thread_id):
 
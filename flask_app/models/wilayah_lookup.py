@@ -1,4 +1,6 @@
 import csv
+import heapq
+from bisect import bisect_left
 
 def load_all_regions(filepath):
 
@@ -36,3 +38,119 @@ def find_name_by_code(regions, kode_wilayah):
         if region['kode_wilayah'] == kode_wilayah:
             return region  # Return the full region (kode_wilayah and name)
     return None
+
+def parent_code(kode_wilayah):
+    # "11.01.01" -> "11.01"; provinces have no parent
+    if '.' not in kode_wilayah:
+        return None
+    return kode_wilayah.rsplit('.', 1)[0]
+
+def region_level(kode_wilayah):
+    # 1 province, 2 regency/city, 3 district, 4 village
+    return kode_wilayah.count('.') + 1
+
+
+class RegionIndex:
+    """
+    Lookup structures over the regions of base.csv, built once at load time.
+
+    Lowercased names are kept sorted next to each row's position in the file,
+    so a prefix query is two bisects plus the matching slice. Results are put
+    back in file order, matching suggest_regions_by_name and get_codes_by_name.
+
+    The dotted codes form a tree (province 11, regency 11.01, district
+    11.01.01, village 11.01.01.2001): codes map straight to their row, and
+    each code keeps its children in file order.
+    """
+
+    # Sorts after any character a region name can contain, so prefix + this bounds every match
+    _PREFIX_END = '\U0010ffff'
+
+    def __init__(self, regions, source_sha256=None):
+        self.regions = regions
+        # Digest of the CSV the regions came from, when known; versions cached responses
+        self.source_sha256 = source_sha256
+        order = sorted(range(len(regions)), key=lambda position: regions[position]['name'].lower())
+        self._sorted_names = [regions[position]['name'].lower() for position in order]
+        self._sorted_positions = order
+
+        self._positions_by_code = {}
+        self._children = {None: []}
+        for position, region in enumerate(regions):
+            code = region['kode_wilayah']
+            self._positions_by_code[code] = position
+            self._children.setdefault(parent_code(code), []).append(position)
+
+    def __len__(self):
+        return len(self.regions)
+
+    def region_at(self, position):
+        return self.regions[position]
+
+    def _prefix_range(self, query):
+        # Slots in name order holding every region whose lowercased name starts with the query
+        prefix = query.lower()
+        start = bisect_left(self._sorted_names, prefix)
+        end = bisect_left(self._sorted_names, prefix + self._PREFIX_END, start)
+        return start, end
+
+    def _prefix_positions(self, query):
+        # Positions in base.csv of every region whose lowercased name starts with the query
+        start, end = self._prefix_range(query)
+        return self._sorted_positions[start:end]
+
+    def suggest_by_name(self, query, limit=10):
+        positions = heapq.nsmallest(limit, self._prefix_positions(query))
+        return [{'name': self.region_at(position)['name']} for position in positions]
+
+    def codes_by_name(self, query):
+        return [{'kode_wilayah': self.region_at(position)['kode_wilayah']}
+                for position in sorted(self._prefix_positions(query))]
+
+    def iter_codes_by_name(self, query):
+        """
+        Yield the same codes as codes_by_name, but in name order rather than file
+        order: the matches are one contiguous run of the sorted names, so they are
+        walked in place and the first result comes without collecting the rest.
+        """
+        start, end = self._prefix_range(query)
+        for slot in range(start, end):
+            yield {'kode_wilayah': self.region_at(self._sorted_positions[slot])['kode_wilayah']}
+
+    def codes_by_name_page(self, query, after=None, limit=100):
+        """
+        One page of codes_by_name, starting after the row at position `after`.
+
+        Returns the page and the position to pass as `after` for the next one,
+        or None when this is the last page.
+        """
+        positions = self._prefix_positions(query)
+        if after is not None:
+            positions = (position for position in positions if position > after)
+        page = heapq.nsmallest(limit + 1, positions)
+        next_after = page[limit - 1] if len(page) > limit else None
+        return [{'kode_wilayah': self.region_at(position)['kode_wilayah']} for position in page[:limit]], next_after
+
+    def get(self, kode_wilayah):
+        """The region with this code, or None; same result as find_name_by_code."""
+        position = self._positions_by_code.get(kode_wilayah)
+        return self.region_at(position) if position is not None else None
+
+    def parent(self, kode_wilayah):
+        code = parent_code(kode_wilayah)
+        return self.get(code) if code is not None else None
+
+    def children(self, kode_wilayah=None):
+        """Regions directly below a code in file order; provinces when the code is None."""
+        return [self.region_at(position) for position in self._children.get(kode_wilayah, [])]
+
+    def ancestors(self, kode_wilayah):
+        """Regions above a code, from the province down to its parent."""
+        ancestors = []
+        code = parent_code(kode_wilayah)
+        while code is not None:
+            region = self.get(code)
+            if region is not None:
+                ancestors.append(region)
+            code = parent_code(code)
+        return ancestors[::-1]
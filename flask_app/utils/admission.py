@@ -0,0 +1,118 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+
+class Overloaded(RuntimeError):
+    """Raised when a request is shed; `retry_after` is a hint in whole seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded wait queue and per-key limits.
+
+    At most `max_concurrent` requests run at once, and at most `per_key_limits`
+    (or `default_per_key`) of them for the same key, e.g. the same plant.
+    Requests over the limit wait up to `queue_timeout` seconds, but only
+    `max_queue` of them may wait at a time; anything beyond that, or anything
+    that waits too long, is shed with Overloaded instead of piling up.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 32, queue_timeout: float = 2.0,
+                 default_per_key: Optional[int] = None, per_key_limits: Optional[Dict[str, int]] = None):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.default_per_key = default_per_key or max_concurrent
+        self.per_key_limits = dict(per_key_limits or {})
+        self._cond = threading.Condition()
+        self._active = 0
+        self._active_by_key: Dict[str, int] = {}
+        self._waiting = 0
+        self._service_seconds = None
+        self._stats = {'admitted': 0, 'queued': 0, 'peak_waiting': 0, 'wait_seconds': 0.0,
+                       'shed_queue_full': 0, 'shed_timeout': 0}
+
+    def _limit_for(self, key: str) -> int:
+        return self.per_key_limits.get(key, self.default_per_key)
+
+    def _has_slot(self, key: str) -> bool:
+        return self._active < self.max_concurrent and self._active_by_key.get(key, 0) < self._limit_for(key)
+
+    def _retry_after(self) -> int:
+        # Time for the current queue to drain, assuming every slot keeps working at the average pace
+        service = self._service_seconds or 1.0
+        return max(1, math.ceil(service * (self._waiting + 1) / self.max_concurrent))
+
+    def _shed(self, reason: str, message: str):
+        self._stats[f'shed_{reason}'] += 1
+        raise Overloaded(message, self._retry_after())
+
+    def acquire(self, key: str):
+        with self._cond:
+            if not self._has_slot(key):
+                if self._waiting >= self.max_queue:
+                    self._shed('queue_full', 'Server is busy, try again later')
+
+                self._waiting += 1
+                self._stats['queued'] += 1
+                self._stats['peak_waiting'] = max(self._stats['peak_waiting'], self._waiting)
+                start = time.perf_counter()
+                deadline = start + self.queue_timeout
+                try:
+                    while not self._has_slot(key):
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            self._shed('timeout', 'Server is busy, try again later')
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                    self._stats['wait_seconds'] += time.perf_counter() - start
+
+            self._active += 1
+            self._active_by_key[key] = self._active_by_key.get(key, 0) + 1
+            self._stats['admitted'] += 1
+
+    def release(self, key: str, service_seconds: Optional[float] = None):
+        with self._cond:
+            self._active -= 1
+            self._active_by_key[key] -= 1
+            if service_seconds is not None:
+                # Moving average of how long admitted requests hold their slot, for Retry-After
+                if self._service_seconds is None:
+                    self._service_seconds = service_seconds
+                else:
+                    self._service_seconds = 0.9 * self._service_seconds + 0.1 * service_seconds
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, key: str):
+        """Hold a slot for `key` for the duration of the block, or raise Overloaded."""
+        self.acquire(key)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(key, time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats['active'] = self._active
+            stats['waiting'] = self._waiting
+            stats['active_by_key'] = {key: count for key, count in self._active_by_key.items() if count}
+            stats['avg_service_seconds'] = round(self._service_seconds, 5) if self._service_seconds is not None else None
+        stats['shed'] = stats['shed_queue_full'] + stats['shed_timeout']
+        stats['wait_seconds'] = round(stats['wait_seconds'], 4)
+        stats['max_concurrent'] = self.max_concurrent
+        stats['max_queue'] = self.max_queue
+        stats['queue_timeout'] = self.queue_timeout
+        return stats
@@ -0,0 +1,168 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+import numpy as np
+
+from utils.tflite_model import batch_capacity
+
+
+class _PendingInput:
+    """One caller's preprocessed input waiting in a batch queue."""
+
+    def __init__(self, input_data: np.ndarray):
+        # Callers may reuse their input buffer after submitting, so keep our own copy
+        self.input_data = np.array(input_data[0] if input_data.ndim == 4 else input_data)
+        self.enqueued_at = time.perf_counter()
+        self.future = Future()
+
+
+class MicroBatcher:
+    """
+    Collects concurrent inputs for one model and runs them as a single invoke.
+
+    A background thread takes the first waiting input, then keeps collecting
+    until either `max_batch_size` inputs are queued or `max_wait_ms` has passed
+    since the first one arrived. The batch is stacked, run once through an
+    interpreter built for the next power of two inputs, up to `max_batch_size`
+    (padded when it is short, so no interpreter is ever resized), and each caller gets its own output row
+    together with the version of the model that produced it.
+
+    Up to `max_in_flight` batches run at once, one per interpreter; while all
+    of them are busy, new inputs keep queueing and form the next, fuller batch.
+    """
+
+    def __init__(self, registry, model_name: str, max_batch_size: int = 8, max_wait_ms: float = 5.0,
+                 max_in_flight: int = 1):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.registry = registry
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_in_flight = max_in_flight
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=f"batcher-{model_name}")
+        self._in_flight = 0
+        self._stats = {'requests': 0, 'batches': 0, 'max_batch_size_seen': 0, 'peak_in_flight': 0,
+                       'queue_delay_seconds': 0.0, 'max_queue_delay_seconds': 0.0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{model_name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, input_data: np.ndarray) -> Future:
+        """Queue a (1, H, W, C) or (H, W, C) input and return a future for (output row, model version)."""
+        pending = _PendingInput(input_data)
+        self._queue.put(pending)
+        return pending.future
+
+    def predict(self, input_data: np.ndarray, timeout: Optional[float] = None) -> Tuple[np.ndarray, str]:
+        """Submit an input and block until its (predictions, model version) are ready."""
+        return self.submit(input_data).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    # Still take whatever is already waiting, without blocking
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Wait for a free slot first, so inputs arriving meanwhile join the next batch
+            self._slots.acquire()
+            batch = self._collect()
+            with self._lock:
+                self._in_flight += 1
+                self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._in_flight)
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch):
+        try:
+            self._invoke(batch)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def _invoke(self, batch):
+        flushed_at = time.perf_counter()
+        try:
+            stacked = np.stack([pending.input_data for pending in batch])
+            model = self.registry.get(self.model_name)
+            # A lone request runs on the single-image interpreters; fuller batches on the next power of two
+            outputs = model.run_batch_inference(stacked, batch_size=batch_capacity(len(batch), self.max_batch_size))
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+
+        for row, pending in zip(outputs, batch):
+            pending.future.set_result((row, model.version))
+
+        delays = [flushed_at - pending.enqueued_at for pending in batch]
+        with self._lock:
+            self._stats['requests'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['max_batch_size_seen'] = max(self._stats['max_batch_size_seen'], len(batch))
+            self._stats['queue_delay_seconds'] += sum(delays)
+            self._stats['max_queue_delay_seconds'] = max(self._stats['max_queue_delay_seconds'], max(delays))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['in_flight'] = self._in_flight
+        stats['avg_batch_size'] = round(stats['requests'] / stats['batches'], 3) if stats['batches'] else 0.0
+        stats['avg_queue_delay_seconds'] = round(stats['queue_delay_seconds'] / stats['requests'], 5) if stats['requests'] else 0.0
+        stats['queue_delay_seconds'] = round(stats['queue_delay_seconds'], 4)
+        stats['max_queue_delay_seconds'] = round(stats['max_queue_delay_seconds'], 5)
+        return stats
+
+
+class BatchScheduler:
+    """Creates one MicroBatcher per model on first use."""
+
+    def __init__(self, registry, max_batch_size: int = 8, max_wait_ms: float = 5.0, max_in_flight: int = 1):
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_in_flight = max_in_flight
+        self._batchers: Dict[str, MicroBatcher] = {}
+        self._lock = threading.Lock()
+
+    def get_batcher(self, model_name: str) -> MicroBatcher:
+        with self._lock:
+            batcher = self._batchers.get(model_name)
+            if batcher is None:
+                batcher = MicroBatcher(self.registry, model_name, max_batch_size=self.max_batch_size,
+                                       max_wait_ms=self.max_wait_ms, max_in_flight=self.max_in_flight)
+                self._batchers[model_name] = batcher
+            return batcher
+
+    def predict(self, model_name: str, input_data: np.ndarray, timeout: Optional[float] = None) -> Tuple[np.ndarray, str]:
+        return self.get_batcher(model_name).predict(input_data, timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            batchers = dict(self._batchers)
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'max_in_flight': self.max_in_flight,
+            'models': {name: batcher.stats() for name, batcher in batchers.items()},
+        }
@@ -0,0 +1,92 @@
+import io
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import quote
+
+from utils.storage_client import get_storage_client
+
+def public_url(bucket_name: str, blob_name: str) -> str:
+    """The public URL GCS serves an object under, computed without an API call."""
+    return f"https://storage.googleapis.com/{bucket_name}/{quote(blob_name)}"
+
+def upload_stream(bucket_name: str, blob_name: str, stream, content_type: Optional[str] = None) -> str:
+    """
+    Stream a file object to GCS as a publicly readable object and return its URL.
+
+    The public-read ACL is set in the upload request itself, so no separate
+    `make_public()` call is needed.
+    """
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+    blob.upload_from_file(stream, content_type=content_type, predefined_acl='publicRead', rewind=True)
+    return blob.public_url
+
+
+class _UploadJob:
+    def __init__(self, bucket_name, blob_name, data, content_type, on_failure):
+        self.bucket_name = bucket_name
+        self.blob_name = blob_name
+        self.data = data
+        self.content_type = content_type
+        self.on_failure = on_failure
+        self.attempts = 0
+
+
+class UploadQueue:
+    """
+    Background uploader for photos whose URL can be returned before the upload finishes.
+
+    `submit` returns the object's deterministic public URL right away. Worker
+    threads upload the bytes, retrying with exponential backoff, and call the
+    job's `on_failure` callback once every attempt has failed.
+    """
+
+    def __init__(self, num_workers: int = 4, max_attempts: int = 3, backoff_seconds: float = 1.0):
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'uploaded': 0, 'retries': 0, 'failed': 0}
+        for index in range(num_workers):
+            thread = threading.Thread(target=self._run, name=f"photo-upload-{index}", daemon=True)
+            thread.start()
+
+    def submit(self, bucket_name: str, blob_name: str, data: bytes, content_type: Optional[str] = None,
+               on_failure: Optional[Callable[[Exception], Any]] = None) -> str:
+        self._queue.put(_UploadJob(bucket_name, blob_name, data, content_type, on_failure))
+        with self._lock:
+            self._stats['submitted'] += 1
+        return public_url(bucket_name, blob_name)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            while True:
+                job.attempts += 1
+                try:
+                    upload_stream(job.bucket_name, job.blob_name, io.BytesIO(job.data), job.content_type)
+                    with self._lock:
+                        self._stats['uploaded'] += 1
+                    break
+                except Exception as e:
+                    if job.attempts < self.max_attempts:
+                        with self._lock:
+                            self._stats['retries'] += 1
+                        time.sleep(self.backoff_seconds * 2 ** (job.attempts - 1))
+                        continue
+                    with self._lock:
+                        self._stats['failed'] += 1
+                    print(f"Upload of {job.blob_name} failed after {job.attempts} attempts: {e}")
+                    if job.on_failure is not None:
+                        try:
+                            job.on_failure(e)
+                        except Exception as callback_error:
+                            print(f"Upload failure callback for {job.blob_name} failed: {callback_error}")
+                    break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
@@ -0,0 +1,117 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from PIL import Image, ImageOps
+
+from utils.gcs_uploads import public_url, upload_stream
+from utils.storage_client import get_storage_client
+
+# Read size when derivatives are decoded from the stored original instead of request bytes
+SOURCE_CHUNK_SIZE = 256 * 1024
+
+def derivative_blob_name(blob_name: str, size: int) -> str:
+    """Name of a resized copy stored next to the original, e.g. threads/leaf_128.webp."""
+    root, _ = os.path.splitext(blob_name)
+    return f"{root}_{size}.webp"
+
+def derivative_urls(bucket_name: str, blob_name: str, sizes: Iterable[int]) -> Dict[str, str]:
+    """Public URLs of every derivative of `blob_name`, keyed by size."""
+    return {str(size): public_url(bucket_name, derivative_blob_name(blob_name, size)) for size in sizes}
+
+def make_derivatives(source, sizes: Iterable[int], quality: int = 80) -> Dict[int, bytes]:
+    """
+    Return WebP copies of the image whose longer side is at most each of `sizes`.
+
+    `source` is the image's bytes or a binary file object; it is decoded once,
+    at the largest size, and each smaller copy is scaled from the one before.
+    """
+    sizes = sorted(sizes, reverse=True)
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    if image.format == 'JPEG':
+        # Decode at a reduced scale straight away; camera photos are far larger than any derivative
+        image.draft('RGB', (sizes[0], sizes[0]))
+    # Phone cameras store rotation in EXIF; bake it in since WebP derivatives drop the tag
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    derivatives = {}
+    for size in sizes:
+        image.thumbnail((size, size), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format='WEBP', quality=quality, method=4)
+        derivatives[size] = output.getvalue()
+    return derivatives
+
+
+class DerivativePipeline:
+    """
+    Creates and uploads resized WebP copies of uploaded photos in a thread pool.
+
+    Resizing and encoding happen on pool threads (Pillow releases the GIL
+    while doing both), followed by the upload of each derivative next to the
+    original. Only once every derivative is stored does `on_success` get
+    their public URLs, so nothing links to an object that does not exist yet.
+    Without `data`, the original is streamed back from GCS, so callers that
+    streamed the upload never hold the whole photo in memory.
+    """
+
+    def __init__(self, sizes: Iterable[int] = (128, 512), max_workers: Optional[int] = None):
+        self.sizes = tuple(sorted(sizes))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1,
+                                            thread_name_prefix='photo-derivatives')
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'created': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def urls(self, bucket_name: str, blob_name: str) -> Dict[str, str]:
+        return derivative_urls(bucket_name, blob_name, self.sizes)
+
+    def submit(self, bucket_name: str, blob_name: str, data: Optional[bytes] = None,
+               on_success: Optional[Callable[[Dict[str, str]], Any]] = None,
+               on_failure: Optional[Callable[[Exception], Any]] = None):
+        with self._lock:
+            self._stats['submitted'] += 1
+        self._executor.submit(self._process, bucket_name, blob_name, data, on_success, on_failure)
+
+    def _process(self, bucket_name, blob_name, data, on_success, on_failure):
+        try:
+            if data is not None:
+                derivatives = make_derivatives(data, self.sizes)
+                bytes_in = len(data)
+            else:
+                blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+                with blob.open('rb', chunk_size=SOURCE_CHUNK_SIZE) as source:
+                    derivatives = make_derivatives(source, self.sizes)
+                    bytes_in = source.tell()
+            for size, derivative in derivatives.items():
+                upload_stream(bucket_name, derivative_blob_name(blob_name, size), io.BytesIO(derivative),
+                              content_type='image/webp')
+                with self._lock:
+                    self._stats['created'] += 1
+                    self._stats['bytes_out'] += len(derivative)
+            with self._lock:
+                self._stats['bytes_in'] += bytes_in
+        except Exception as e:
+            with self._lock:
+                self._stats['failed'] += 1
+            print(f"Could not create derivatives for {blob_name}: {e}")
+            if on_failure is not None:
+                try:
+                    on_failure(e)
+                except Exception as callback_error:
+                    print(f"Derivative failure callback for {blob_name} failed: {callback_error}")
+            return
+
+        if on_success is not None:
+            try:
+                on_success(self.urls(bucket_name, blob_name))
+            except Exception as callback_error:
+                print(f"Derivative success callback for {blob_name} failed: {callback_error}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['sizes'] = list(self.sizes)
+        return stats
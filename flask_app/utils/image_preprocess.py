@@ -1,13 +1,69 @@
 from PIL import Image
+import io
+import threading
 import numpy as np
 
-def preprocess_image(image_path, target_size):
+# Per-thread normalized input buffers, reused across calls to avoid reallocating
+_buffers = threading.local()
 
-    image = Image.open(image_path).convert('RGB')
-    image = image.resize(target_size)
-    image_array = np.array(image, dtype=np.float32)
+def _open_image(image_source):
+    """Open an image from a file path, raw bytes or a binary stream."""
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        image_source = io.BytesIO(image_source)
+    return Image.open(image_source)
 
-    # Normalize the image data to [0, 1] if required by the model
-    image_array = image_array / 255.0
-    image_array = np.expand_dims(image_array, axis=0)  # Add batch dimension
-    return image_array
+def _get_buffer(target_size):
+    width, height = target_size
+    buffer = getattr(_buffers, 'input', None)
+    if buffer is None or buffer.shape != (1, height, width, 3):
+        buffer = np.empty((1, height, width, 3), dtype=np.float32)
+        _buffers.input = buffer
+    return buffer
+
+def load_resized_image(image_source, target_size):
+    """Decode an image straight to `target_size` RGB, skipping work where the format allows it."""
+    image = _open_image(image_source)
+    if image.format == 'JPEG':
+        # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding, never below target size
+        image.draft('RGB', target_size)
+    image = image.convert('RGB')
+    # reducing_gap uses Image.reduce() for the bulk of large downscales before resampling
+    return image.resize(target_size, Image.BICUBIC, reducing_gap=3.0)
+
+def load_image_pixels(image_source, target_size):
+    """Return the resized image as a (H, W, 3) uint8 array, for models with quantized inputs."""
+    image = load_resized_image(image_source, target_size)
+    return np.asarray(image, dtype=np.uint8)
+
+def preprocess_image(image_source, target_size, out=None):
+    """
+    Return a (1, H, W, 3) float32 array with pixels scaled to [0, 1].
+
+    `image_source` may be a path, bytes or a binary stream. The result is written
+    into `out` when given (a (1, H, W, 3) or (H, W, 3) float32 array, e.g. a row
+    of a batch). Otherwise a per-thread buffer is reused, so the returned array is
+    only valid until the same thread preprocesses another image.
+    """
+    pixels = load_image_pixels(image_source, target_size)
+
+    if out is None:
+        out = _get_buffer(target_size)
+
+    # Normalize the image data to [0, 1] in a single pass into the buffer
+    np.divide(pixels, 255.0, out=out[0] if out.ndim == 4 else out, dtype=np.float32)
+    return out
+
+def preprocess_for_spec(spec, image_source, out=None):
+    """
+    Decode an image into the input size and dtype described by a model's InputSpec.
+
+    Quantized models take uint8 pixels mapped through the spec's lookup table,
+    skipping the float pass; float models get `preprocess_image` output.
+    """
+    if spec.is_quantized:
+        pixels = load_image_pixels(image_source, spec.target_size)
+        if out is None:
+            return spec.from_pixels(pixels)[np.newaxis]
+        spec.from_pixels(pixels, out=out[0] if out.ndim == 4 else out)
+        return out
+    return preprocess_image(image_source, target_size=spec.target_size, out=out)
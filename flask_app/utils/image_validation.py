@@ -0,0 +1,127 @@
+import io
+import os
+import threading
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+from PIL import Image
+
+# Leading bytes of every format we might accept, checked before Pillow sees the file
+_SIGNATURES = (
+    ('JPEG', 0, b'\xff\xd8\xff'),
+    ('PNG', 0, b'\x89PNG\r\n\x1a\n'),
+    ('GIF', 0, b'GIF87a'),
+    ('GIF', 0, b'GIF89a'),
+    ('BMP', 0, b'BM'),
+    ('WEBP', 8, b'WEBP'),
+)
+_SNIFF_BYTES = 16
+
+
+class ImageRejected(ValueError):
+    """Raised for an upload that fails validation; `status_code` is the HTTP status to answer with."""
+
+    def __init__(self, reason: str, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.reason = reason
+        self.status_code = status_code
+
+
+class ImageInfo(NamedTuple):
+    format: str
+    width: int
+    height: int
+    size: int
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    """Name of the image format whose signature `header` starts with, or None."""
+    for name, offset, signature in _SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            if name == 'WEBP' and header[:4] != b'RIFF':
+                continue
+            return name
+    return None
+
+
+class ImageValidator:
+    """
+    Checks an upload's format, dimensions and byte size without decoding it.
+
+    Only the first bytes are read to sniff the format, then Pillow parses the
+    header for the dimensions; no pixel data is decoded. Accepts bytes or a
+    seekable file object, which is rewound to where it started. Rejections
+    are counted by reason.
+    """
+
+    def __init__(self, max_bytes: int = 10 * 1024 * 1024, max_pixels: int = 64_000_000,
+                 max_side: int = 12000, formats: Iterable[str] = ('JPEG', 'PNG', 'WEBP')):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.max_side = max_side
+        self.formats = tuple(fmt.upper() for fmt in formats)
+        self._lock = threading.Lock()
+        self._accepted = 0
+        self._rejected: Dict[str, int] = {}
+
+    def _reject(self, reason: str, message: str, status_code: int = 400):
+        with self._lock:
+            self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        raise ImageRejected(reason, message, status_code)
+
+    def validate(self, source) -> ImageInfo:
+        """Return the upload's format, width, height and byte size, or raise ImageRejected."""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            stream = io.BytesIO(source)
+            start, size = 0, len(source)
+        else:
+            stream = source
+            start = stream.tell()
+            stream.seek(0, os.SEEK_END)
+            size = stream.tell() - start
+            stream.seek(start)
+
+        try:
+            if size == 0:
+                self._reject('empty', 'Image file is empty')
+            if size > self.max_bytes:
+                self._reject('too_large', f'Image is larger than {self.max_bytes} bytes', 413)
+
+            image_format = sniff_format(stream.read(_SNIFF_BYTES))
+            stream.seek(start)
+            if image_format not in self.formats:
+                self._reject('unsupported_format',
+                             f'Unsupported image format, expected one of {", ".join(self.formats)}')
+
+            try:
+                # Image.open only parses the header; pixels are decoded lazily on first access
+                with Image.open(stream, formats=[image_format]) as image:
+                    width, height = image.size
+            except Image.DecompressionBombError:
+                self._reject('too_many_pixels', f'Image has more than {self.max_pixels} pixels', 413)
+            except Exception:
+                self._reject('corrupt', 'Image header could not be read')
+
+            if width > self.max_side or height > self.max_side:
+                self._reject('dimensions', f'Image sides must be at most {self.max_side} pixels', 413)
+            if width * height > self.max_pixels:
+                self._reject('too_many_pixels', f'Image has more than {self.max_pixels} pixels', 413)
+        finally:
+            stream.seek(start)
+
+        with self._lock:
+            self._accepted += 1
+        return ImageInfo(image_format, width, height, size)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rejected = dict(self._rejected)
+            accepted = self._accepted
+        return {
+            'accepted': accepted,
+            'rejected': sum(rejected.values()),
+            'rejected_by_reason': rejected,
+            'max_bytes': self.max_bytes,
+            'max_pixels': self.max_pixels,
+            'max_side': self.max_side,
+            'formats': list(self.formats),
+        }
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+FLASK_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class WorkerCrashedError(RuntimeError):
+    """Raised when a worker process dies or stops answering while handling a request."""
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Attach to a block owned by the parent without letting this process unlink it on exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers every attached block with the resource tracker
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class _Worker:
+    """One worker process, its control connection and its shared input block."""
+
+    def __init__(self, index: int, config: Dict[str, Any], max_input_bytes: int):
+        self.index = index
+        self.config = config
+        self.input_shm = shared_memory.SharedMemory(create=True, size=max_input_bytes)
+        self.process = None
+        self.conn = None
+
+    def start(self):
+        parent_sock, child_sock = socket.socketpair()
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [FLASK_APP_DIR, env.get('PYTHONPATH')]))
+        command = [
+            sys.executable, '-m', 'utils.inference_workers',
+            '--fd', str(child_sock.fileno()),
+            '--input-shm', self.input_shm.name,
+            '--config', json.dumps(self.config),
+        ]
+        self.process = subprocess.Popen(command, pass_fds=(child_sock.fileno(),), env=env)
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+
+    def stop(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def close(self):
+        self.stop()
+        self.input_shm.close()
+        self.input_shm.unlink()
+
+
+class InferenceWorkerPool:
+    """
+    Fixed-size pool of processes that decode images and run TFLite inference.
+
+    Each worker is a standalone `python -m utils.inference_workers` process with
+    its own model registry and interpreters, so decode and invoke no longer
+    compete for the GIL of the Flask process. A request checks out an idle
+    worker and copies the upload into that worker's shared memory block; only
+    small control messages and the output scores cross the worker's socket.
+    A worker that has died, or that crashes or times out mid-request, is
+    restarted before it is used again.
+    """
+
+    def __init__(self, num_workers: int, config: Dict[str, Any], max_input_bytes: int = 16 * 1024 * 1024,
+                 request_timeout: float = 30.0):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.max_input_bytes = max_input_bytes
+        self.request_timeout = request_timeout
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._model_versions: Dict[str, str] = {}
+        self._stats = {'requests': 0, 'errors': 0, 'crashes': 0, 'restarts': 0, 'busy_seconds': 0.0}
+        self._started_at = time.perf_counter()
+        for index in range(num_workers):
+            worker = _Worker(index, config, max_input_bytes)
+            worker.start()
+            self._workers.append(worker)
+            self._idle.put(worker)
+
+    def _restart(self, worker: _Worker):
+        worker.stop()
+        worker.start()
+        with self._lock:
+            self._stats['restarts'] += 1
+
+    def _request(self, worker: _Worker, message) -> Any:
+        try:
+            worker.conn.send(message)
+            if not worker.conn.poll(self.request_timeout):
+                raise WorkerCrashedError(f"Inference worker {worker.index} timed out")
+            return worker.conn.recv()
+        except (EOFError, OSError) as e:
+            raise WorkerCrashedError(f"Inference worker {worker.index} crashed: {e}")
+
+    def predict(self, model_name: str, image_bytes: bytes) -> Tuple[np.ndarray, str]:
+        """Decode and classify one upload in a worker; returns (predictions, model version)."""
+        if len(image_bytes) > self.max_input_bytes:
+            raise ValueError(f"Image is larger than {self.max_input_bytes} bytes")
+
+        worker = self._idle.get()
+        start = time.perf_counter()
+        try:
+            if not worker.is_alive():
+                self._restart(worker)
+            worker.input_shm.buf[:len(image_bytes)] = image_bytes
+            try:
+                response = self._request(worker, ('predict', model_name, len(image_bytes)))
+            except WorkerCrashedError:
+                with self._lock:
+                    self._stats['crashes'] += 1
+                self._restart(worker)
+                raise
+        finally:
+            with self._lock:
+                self._stats['requests'] += 1
+                self._stats['busy_seconds'] += time.perf_counter() - start
+            self._idle.put(worker)
+
+        if response[0] != 'ok':
+            with self._lock:
+                self._stats['errors'] += 1
+            raise RuntimeError(response[1])
+
+        _, predictions, model_version = response
+        with self._lock:
+            self._model_versions[model_name] = model_version
+        return predictions, model_version
+
+    def model_version(self, model_name: str) -> Optional[str]:
+        """Version of `model_name` most recently reported by any worker, if it has run yet."""
+        with self._lock:
+            return self._model_versions.get(model_name)
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        elapsed = time.perf_counter() - self._started_at
+        stats['workers'] = len(self._workers)
+        stats['alive'] = sum(1 for worker in self._workers if worker.is_alive())
+        stats['idle'] = self._idle.qsize()
+        stats['utilization'] = round(stats['busy_seconds'] / (elapsed * len(self._workers)), 4) if elapsed > 0 else 0.0
+        stats['busy_seconds'] = round(stats['busy_seconds'], 4)
+        return stats
+
+
+def _worker_main():
+    from utils.tflite_model import TFLiteModelRegistry, LocalModelSource
+    from utils.image_preprocess import preprocess_for_spec
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fd', type=int, required=True)
+    parser.add_argument('--input-shm', required=True)
+    parser.add_argument('--config', required=True)
+    args = parser.parse_args()
+
+    config = json.loads(args.config)
+    conn = Connection(args.fd)
+    input_shm = _attach_shared_memory(args.input_shm)
+
+    model_dir = config.get('model_dir')
+    registry = TFLiteModelRegistry(
+        config['bucket_name'],
+        cache_dir=config.get('cache_dir'),
+        pool_size=1,
+        num_threads=config.get('num_threads'),
+        profile_path=config.get('profile_path'),
+        source=LocalModelSource(model_dir) if model_dir else None,
+    )
+    registry.start_reload_watcher(config.get('reload_interval', 0))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        try:
+            _, model_name, size = message
+            model = registry.get(model_name)
+            image = input_shm.buf[:size]
+            try:
+                input_data = preprocess_for_spec(model.input_spec, image)
+            finally:
+                image.release()
+            predictions = model.run_inference(input_data)
+            conn.send(('ok', predictions, model.version))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+    input_shm.close()
+
+
+if __name__ == '__main__':
+    _worker_main()
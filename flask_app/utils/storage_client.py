@@ -0,0 +1,33 @@
+import os
+import threading
+from typing import Dict
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+
+# Keep-alive connections per client, shared by uploads and model downloads
+GCS_CONNECTION_POOL_SIZE = int(os.environ.get('GCS_CONNECTION_POOL_SIZE', 32))
+
+_clients: Dict[str, storage.Client] = {}
+_clients_lock = threading.Lock()
+
+def get_storage_client(credentials_path: str = "bucket.json", pool_size: int = GCS_CONNECTION_POOL_SIZE) -> storage.Client:
+    """
+    Return one shared storage client per credentials file.
+
+    The client is built once per process, so `bucket.json` is parsed once and
+    HTTP connections are kept alive across uploads and model downloads. Its
+    connection pool is widened to `pool_size` so concurrent requests do not
+    keep opening and discarding connections.
+    """
+    with _clients_lock:
+        client = _clients.get(credentials_path)
+        if client is None:
+            credentials = service_account.Credentials.from_service_account_file(
+                credentials_path, scopes=storage.Client.SCOPE)
+            session = AuthorizedSession(credentials)
+            session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+            client = storage.Client(project=credentials.project_id, credentials=credentials, _http=session)
+            _clients[credentials_path] = client
+        return client
@@ -1,50 +1,727 @@
-import tensorflow as tf
 from google.cloud import storage
+from utils.storage_client import get_storage_client
 import numpy as np
 import json
-from typing import Dict, Any
+import hashlib
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Optional
 import os
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
+# A tflite_runtime or tf.lite interpreter, depending on the active backend
+Interpreter = Any
+
+# 'auto' prefers the standalone tflite_runtime package and falls back to tensorflow
+TFLITE_BACKEND = os.environ.get('TFLITE_BACKEND', 'auto')
+
+# Input rows all interpreters of one batch size may hold together; each interpreter keeps its own
+# batch-sized input and activation tensors, so large batch sizes get fewer interpreters
+BATCH_INTERPRETER_MAX_ROWS = int(os.environ.get('BATCH_INTERPRETER_MAX_ROWS', 64))
+
+class InterpreterBackend:
+    """The interpreter class and delegate helpers of one TFLite package."""
+
+    def __init__(self, name: str, interpreter_class, load_delegate, op_resolver_type):
+        self.name = name
+        self.interpreter_class = interpreter_class
+        self.load_delegate = load_delegate
+        self.op_resolver_type = op_resolver_type
+
+_backend: Optional[InterpreterBackend] = None
+_backend_lock = threading.Lock()
+
+def _import_backend(name: str) -> InterpreterBackend:
+    if name == 'tflite_runtime':
+        from tflite_runtime.interpreter import Interpreter as TFLiteInterpreter, load_delegate, OpResolverType
+        return InterpreterBackend('tflite_runtime', TFLiteInterpreter, load_delegate, OpResolverType)
+    if name == 'tensorflow':
+        # Importing full TensorFlow takes seconds and hundreds of MB, so only do it on demand
+        import tensorflow as tf
+        return InterpreterBackend('tensorflow', tf.lite.Interpreter,
+                                  tf.lite.experimental.load_delegate, tf.lite.experimental.OpResolverType)
+    raise ValueError(f"Unknown TFLite backend: {name}")
+
+def get_interpreter_backend() -> InterpreterBackend:
+    """Import the interpreter backend on first use and return it."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if TFLITE_BACKEND == 'auto':
+                try:
+                    _backend = _import_backend('tflite_runtime')
+                except ImportError:
+                    _backend = _import_backend('tensorflow')
+            else:
+                _backend = _import_backend(TFLITE_BACKEND)
+        return _backend
+
+def machine_profile_key() -> str:
+    """Key under which autotune results for this machine type are stored, e.g. '8cpu'."""
+    return f"{os.cpu_count() or 1}cpu"
+
+def load_interpreter_profile(profile_path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Return the autotuned interpreter settings for this machine, keyed by model name.
+
+    Missing or unreadable profiles yield an empty dict, so interpreters fall back
+    to the runtime defaults.
+    """
+    if not profile_path or not os.path.exists(profile_path):
+        return {}
+    try:
+        with open(profile_path, 'r') as f:
+            profile = json.load(f)
+        return profile.get('machines', {}).get(machine_profile_key(), {})
+    except Exception as e:
+        print(f"Error loading interpreter profile from {profile_path}: {e}")
+        return {}
+
+def save_interpreter_profile(profile_path: str, settings: Dict[str, Dict[str, Any]]):
+    """Store per-model settings for this machine, keeping entries for other machine types."""
+    profile = {'machines': {}}
+    if os.path.exists(profile_path):
+        with open(profile_path, 'r') as f:
+            profile = json.load(f)
+    profile.setdefault('machines', {}).setdefault(machine_profile_key(), {}).update(settings)
+    with open(profile_path, 'w') as f:
+        json.dump(profile, f, indent=2, sort_keys=True)
+
 def load_class_names(json_path: str = './utils/class_names.json') -> Dict[str, Dict[int, str]]:
 
     try:
         with open(json_path, 'r') as f:
             # Load class names from JSON
             class_data = json.load(f)
-            
+
             # Convert string keys to integers for class indices
             formatted_data = {}
             for plant, classes in class_data.items():
                 formatted_data[plant] = {int(k): v for k, v in classes.items()}
-            
+
             return formatted_data
     except Exception as e:
         print(f"Error loading class names from {json_path}: {e}")
         raise e
 
-def load_tflite_model_from_gcs(bucket_name: str, model_name: str):
+def model_name_for_plant(plant: str) -> str:
+    """Return the GCS model file name used for a plant, e.g. 'corn' -> 'Corn.tflite'."""
+    return f"{plant.capitalize()}.tflite"
 
-    try:
-        client = storage.Client.from_service_account_json("bucket.json")
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(f"models/{model_name}")
+def create_interpreter(model_content: bytes, num_threads: Optional[int] = None,
+                       delegate: str = 'xnnpack') -> Interpreter:
+    """
+    Build an interpreter from raw model bytes and allocate its tensors.
+
+    `delegate` is 'xnnpack' (the runtime default), 'none' for the plain builtin
+    kernels, or the path of an external delegate library.
+    """
+    backend = get_interpreter_backend()
+    kwargs = {'model_content': model_content, 'num_threads': num_threads}
+    if delegate == 'none':
+        kwargs['experimental_op_resolver_type'] = backend.op_resolver_type.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+    elif delegate != 'xnnpack':
+        kwargs['experimental_delegates'] = [backend.load_delegate(delegate)]
+    interpreter = backend.interpreter_class(**kwargs)
+    interpreter.allocate_tensors()
+    return interpreter
+
+def batch_capacity(count: int, max_batch_size: int) -> int:
+    """
+    Interpreter batch size for `count` inputs: the next power of two, capped at
+    `max_batch_size`. A few fixed shapes keep interpreters from being resized
+    while padding a short batch by less than half.
+    """
+    capacity = 1
+    while capacity < count:
+        capacity *= 2
+    return min(capacity, max_batch_size)
 
-        model_content = blob.download_as_bytes()
-        interpreter = tf.lite.Interpreter(model_content=model_content)
+def resize_batch(interpreter: Interpreter, batch_size: int) -> Interpreter:
+    """Give the interpreter a fixed input batch dimension, once, right after it is created."""
+    input_detail = interpreter.get_input_details()[0]
+    if int(input_detail['shape'][0]) != batch_size:
+        interpreter.resize_tensor_input(input_detail['index'], [batch_size] + list(input_detail['shape'][1:]))
         interpreter.allocate_tensors()
-        return interpreter
+    return interpreter
+
+def download_tflite_model_from_gcs(bucket_name: str, model_name: str, client: Optional[storage.Client] = None) -> bytes:
+    """Download the raw bytes of `models/<model_name>` from the given bucket."""
+    if client is None:
+        client = get_storage_client()
+    bucket = client.bucket(bucket_name)
+    blob = bucket.blob(f"models/{model_name}")
+    return blob.download_as_bytes()
+
+def load_tflite_model_from_gcs(bucket_name: str, model_name: str):
+
+    try:
+        model_content = download_tflite_model_from_gcs(bucket_name, model_name)
+        return create_interpreter(model_content)
     except Exception as e:
         print(f"Error loading model {model_name} from GCS: {e}")
         raise e
 
-def run_tflite_inference(interpreter: tf.lite.Interpreter, input_data: np.ndarray) -> Dict[str, Any]:
+class GCSModelSource:
+    """Reads model files from `models/<model_name>` in a GCS bucket."""
 
-    input_details = interpreter.get_input_details()
+    name = 'gcs'
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+
+    def _get_client(self) -> storage.Client:
+        return get_storage_client()
+
+    def _get_blob(self, model_name: str):
+        blob = self._get_client().bucket(self.bucket_name).get_blob(f"models/{model_name}")
+        if blob is None:
+            raise FileNotFoundError(f"models/{model_name} not found in bucket {self.bucket_name}")
+        return blob
+
+    def generation(self, model_name: str) -> str:
+        """Return the object's current generation with a metadata-only request."""
+        return str(self._get_blob(model_name).generation)
+
+    def fetch(self, model_name: str):
+        """Return (bytes, generation), downloading exactly the generation that was looked up."""
+        generation = self._get_blob(model_name).generation
+        bucket = self._get_client().bucket(self.bucket_name)
+        content = bucket.blob(f"models/{model_name}", generation=generation).download_as_bytes()
+        return content, str(generation)
+
+
+class LocalModelSource:
+    """Reads model files from a local directory, for offline runs and benchmarks."""
+
+    name = 'local'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def generation(self, model_name: str) -> str:
+        stat = os.stat(os.path.join(self.directory, model_name))
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def fetch(self, model_name: str):
+        generation = self.generation(model_name)
+        with open(os.path.join(self.directory, model_name), 'rb') as f:
+            return f.read(), generation
+
+
+class InputSpec:
+    """
+    Input dtype and quantization of a model, used to pick a preprocessing path.
+
+    Float models take pixels scaled to [0, 1]. For int8/uint8 models a 256-entry
+    lookup table maps raw uint8 pixels straight to quantized values, so the image
+    never goes through a float32 intermediate. An integer input without
+    quantization parameters (scale 0, common for uint8 image models) takes raw
+    0-255 pixels, shifted by -128 for int8.
+    """
+
+    def __init__(self, input_detail: Dict[str, Any]):
+        self.shape = tuple(int(dim) for dim in input_detail['shape'])
+        self.dtype = np.dtype(input_detail['dtype'])
+        scale, zero_point = input_detail.get('quantization', (0.0, 0))
+        self.scale = float(scale)
+        self.zero_point = int(zero_point)
+        # Any integer input is fed integers; casting [0, 1] floats to it would give only 0s and 1s
+        self.is_quantized = self.dtype in (np.dtype(np.uint8), np.dtype(np.int8))
+        self._scale, self._zero_point = self.scale, self.zero_point
+        if self.is_quantized and self.scale <= 0:
+            # No quantization parameters: one step per pixel value, i.e. the raw pixels
+            self._scale = 1.0 / 255.0
+            self._zero_point = -128 if self.dtype == np.dtype(np.int8) else 0
+        self._lookup = None
+        if self.is_quantized:
+            limits = np.iinfo(self.dtype)
+            normalized = np.arange(256, dtype=np.float64) / 255.0
+            quantized = np.round(normalized / self._scale + self._zero_point)
+            self._lookup = np.clip(quantized, limits.min, limits.max).astype(self.dtype)
+
+    @property
+    def target_size(self):
+        """(width, height) the image must be resized to."""
+        return self.shape[2], self.shape[1]
+
+    def from_pixels(self, pixels: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Map uint8 pixels to this model's quantized input dtype."""
+        return np.take(self._lookup, pixels, out=out)
+
+    def from_float(self, input_data: np.ndarray) -> np.ndarray:
+        """Convert a [0, 1] float input to this model's input dtype."""
+        if input_data.dtype == self.dtype:
+            return input_data
+        if self.is_quantized:
+            limits = np.iinfo(self.dtype)
+            quantized = np.round(input_data / self._scale + self._zero_point)
+            return np.clip(quantized, limits.min, limits.max).astype(self.dtype)
+        return input_data.astype(self.dtype)
+
+    def describe(self) -> Dict[str, Any]:
+        return {'dtype': self.dtype.name, 'scale': self.scale, 'zero_point': self.zero_point}
+
+def dequantize_output(output: np.ndarray, output_detail: Dict[str, Any]) -> np.ndarray:
+    """Return float32 scores for an output tensor, undoing int8/uint8 quantization."""
+    scale, zero_point = output_detail.get('quantization', (0.0, 0))
+    if np.issubdtype(output.dtype, np.integer) and scale > 0:
+        return (output.astype(np.float32) - zero_point) * np.float32(scale)
+    return output.astype(np.float32, copy=False)
+
+def run_tflite_inference(interpreter: Interpreter, input_data: np.ndarray) -> Dict[str, Any]:
+
+    return run_tflite_batch_inference(interpreter, input_data)[0]
+
+def run_tflite_batch_inference(interpreter: Interpreter, input_data: np.ndarray) -> np.ndarray:
+    """
+    Run one invoke over a stacked (N, H, W, C) batch and return all N rows of output.
+
+    The interpreter keeps the batch size it was built with: smaller batches are
+    zero-padded to it, because resizing re-prepares every kernel (and the
+    XNNPACK delegate), which costs more than the padded rows.
+    """
+    input_detail = interpreter.get_input_details()[0]
+    capacity = int(input_detail['shape'][0])
+    count = len(input_data)
+    if count > capacity:
+        raise ValueError(f"Batch of {count} inputs does not fit an interpreter built for {capacity}")
+    if count < capacity:
+        padded = np.zeros((capacity,) + input_data.shape[1:], dtype=input_data.dtype)
+        padded[:count] = input_data
+        input_data = padded
     output_details = interpreter.get_output_details()
 
-    interpreter.set_tensor(input_details[0]['index'], input_data)
+    # Float inputs fed to a quantized or fp16 model are converted here
+    if input_data.dtype != input_detail['dtype']:
+        input_data = InputSpec(input_detail).from_float(input_data)
+
+    interpreter.set_tensor(input_detail['index'], input_data)
     interpreter.invoke()
-    predictions = interpreter.get_tensor(output_details[0]['index'])[0]
-    
-    return predictions
\ No newline at end of file
+    # Copy, since the tensor buffer is reused by the next invoke on this interpreter
+    output = np.array(interpreter.get_tensor(output_details[0]['index'])[:count])
+    return dequantize_output(output, output_details[0])
+
+
+class InterpreterPool:
+    """
+    Bounded pool of interpreters for one model and one input batch size.
+
+    An interpreter must never be invoked from two threads at once, so callers
+    check one out, use it and hand it back. Interpreters are created lazily up
+    to `size`; once all are busy, callers wait for one to be returned.
+    """
+
+    def __init__(self, model_content: bytes, size: int = 1, num_threads: Optional[int] = None,
+                 delegate: str = 'xnnpack', batch_size: int = 1):
+        if size < 1:
+            raise ValueError("Interpreter pool size must be at least 1")
+        self.size = size
+        self.num_threads = num_threads
+        self.delegate = delegate
+        self.batch_size = batch_size
+        self._model_content = model_content
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._started_at = time.perf_counter()
+        self._stats = {'checkouts': 0, 'waits': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+                       'busy_seconds': 0.0, 'peak_in_use': 0}
+        # Build the first interpreter eagerly so a broken model fails at load time
+        interpreter = self._create()
+        self.input_spec = InputSpec(interpreter.get_input_details()[0])
+        self._idle.put(interpreter)
+
+    def _build(self) -> Interpreter:
+        interpreter = create_interpreter(self._model_content, num_threads=self.num_threads, delegate=self.delegate)
+        return resize_batch(interpreter, self.batch_size)
+
+    def _create(self) -> Interpreter:
+        interpreter = self._build()
+        with self._lock:
+            self._created += 1
+        return interpreter
+
+    def acquire(self, timeout: Optional[float] = None) -> Interpreter:
+        start = time.perf_counter()
+        interpreter = None
+        try:
+            interpreter = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    # Reserve the slot before building outside the lock
+                    self._created += 1
+            if can_create:
+                try:
+                    interpreter = self._build()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    interpreter = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError("Timed out waiting for a free interpreter")
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._stats['wait_seconds'] += waited
+            if waited > 0.001:
+                self._stats['waits'] += 1
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+        return interpreter
+
+    def release(self, interpreter: Interpreter, busy_seconds: float = 0.0):
+        with self._lock:
+            self._in_use -= 1
+            self._stats['busy_seconds'] += busy_seconds
+        self._idle.put(interpreter)
+
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None):
+        """Context manager yielding an interpreter that is returned to the pool on exit."""
+        interpreter = self.acquire(timeout=timeout)
+        start = time.perf_counter()
+        try:
+            yield interpreter
+        finally:
+            self.release(interpreter, time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['created'] = self._created
+            stats['in_use'] = self._in_use
+        elapsed = time.perf_counter() - self._started_at
+        stats['size'] = self.size
+        stats['num_threads'] = self.num_threads
+        stats['delegate'] = self.delegate
+        stats['batch_size'] = self.batch_size
+        stats['avg_wait_seconds'] = stats['wait_seconds'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        # Fraction of the pool's total capacity spent running inference
+        stats['utilization'] = stats['busy_seconds'] / (elapsed * self.size) if elapsed > 0 else 0.0
+        for key in ('wait_seconds', 'max_wait_seconds', 'busy_seconds', 'avg_wait_seconds', 'utilization'):
+            stats[key] = round(stats[key], 4)
+        return stats
+
+
+class LoadedModel:
+    """A model that has been downloaded and turned into a pool of ready interpreters."""
+
+    def __init__(self, name: str, content: bytes, pool: InterpreterPool, source: str, load_seconds: float,
+                 generation: Optional[str] = None):
+        self.name = name
+        self.generation = generation
+        self.sha256 = hashlib.sha256(content).hexdigest()
+        self.size = len(content)
+        self.pool = pool
+        # Pools of interpreters built for one batch size each, created on first use
+        self.batch_pools: Dict[int, InterpreterPool] = {}
+        self._batch_pools_lock = threading.Lock()
+        self.input_spec = pool.input_spec
+        self.source = source
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    @property
+    def version(self) -> str:
+        """The source generation when known, otherwise a prefix of the content hash."""
+        return self.generation or self.sha256[:12]
+
+    def run_inference(self, input_data: np.ndarray, timeout: Optional[float] = None) -> np.ndarray:
+        """Run `run_tflite_inference` on an interpreter checked out from this model's pool."""
+        with self.pool.checkout(timeout=timeout) as interpreter:
+            return run_tflite_inference(interpreter, input_data)
+
+    def batch_pool(self, batch_size: int) -> InterpreterPool:
+        """
+        The pool whose interpreters take exactly `batch_size` inputs per invoke.
+
+        Built on first use, with at most BATCH_INTERPRETER_MAX_ROWS // batch_size
+        interpreters (at least one), which are themselves created lazily.
+        """
+        if batch_size == 1:
+            return self.pool
+        with self._batch_pools_lock:
+            pool = self.batch_pools.get(batch_size)
+            if pool is None:
+                size = max(1, min(self.pool.size, BATCH_INTERPRETER_MAX_ROWS // batch_size))
+                pool = InterpreterPool(self.pool._model_content, size=size, num_threads=self.pool.num_threads,
+                                       delegate=self.pool.delegate, batch_size=batch_size)
+                self.batch_pools[batch_size] = pool
+            return pool
+
+    def run_batch_inference(self, input_data: np.ndarray, batch_size: Optional[int] = None,
+                            timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Like `run_inference`, but for a stacked batch; returns one output row per input.
+
+        Callers should pass the same `batch_size` every time (e.g. their largest
+        batch), so their inputs always land on interpreters of that shape.
+        """
+        with self.batch_pool(batch_size or len(input_data)).checkout(timeout=timeout) as interpreter:
+            return run_tflite_batch_inference(interpreter, input_data)
+
+
+class TFLiteModelRegistry:
+    """
+    Process-wide cache of ready TFLite interpreter pools, one per model file.
+
+    Each model is fetched from its source (GCS unless a local directory is
+    configured) at most once per process. The raw bytes are also kept
+    in an on-disk cache next to a SHA-256 sidecar file, so a restarted worker
+    reads the model from disk instead of downloading it again.
+
+    An optional background watcher polls each loaded model's source generation
+    and, when it changes, builds the new interpreter pool off the request path
+    and swaps it in. Requests already holding the old model finish on it.
+    """
+
+    def __init__(self, bucket_name: str, cache_dir: Optional[str] = './model_cache',
+                 pool_size: int = 1, num_threads: Optional[int] = None, profile_path: Optional[str] = None,
+                 source=None):
+        self.bucket_name = bucket_name
+        self.cache_dir = cache_dir
+        self.pool_size = pool_size
+        # An explicit num_threads wins over the autotuned profile
+        self.num_threads = num_threads
+        self.profile = load_interpreter_profile(profile_path)
+        self.source = source if source is not None else GCSModelSource(bucket_name)
+        self._models: Dict[str, LoadedModel] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'disk_loads': 0, 'downloads': 0, 'load_errors': 0,
+                       'update_checks': 0, 'reloads': 0, 'reload_errors': 0,
+                       'stale_disk_cache': 0}
+        self._watcher = None
+        self._stop_watcher = threading.Event()
+
+    def _cache_paths(self, model_name: str):
+        model_path = os.path.join(self.cache_dir, model_name)
+        return model_path, model_path + '.sha256', model_path + '.generation'
+
+    def _read_disk_cache(self, model_name: str):
+        """Return (bytes, generation) of the cached model if present and matching its checksum."""
+        if not self.cache_dir:
+            return None
+        model_path, checksum_path, generation_path = self._cache_paths(model_name)
+        try:
+            with open(checksum_path, 'r') as f:
+                expected = f.read().strip()
+            with open(model_path, 'rb') as f:
+                content = f.read()
+        except OSError:
+            return None
+
+        if hashlib.sha256(content).hexdigest() != expected:
+            print(f"Checksum mismatch for cached model {model_name}, downloading again")
+            return None
+
+        try:
+            with open(generation_path, 'r') as f:
+                generation = f.read().strip() or None
+        except OSError:
+            generation = None
+        return content, generation
+
+    def _write_disk_cache(self, model_name: str, content: bytes, generation: Optional[str] = None):
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            model_path, checksum_path, generation_path = self._cache_paths(model_name)
+            # Write to temp files first so a crash never leaves a half-written model behind
+            tmp_suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+            with open(model_path + tmp_suffix, 'wb') as f:
+                f.write(content)
+            with open(checksum_path + tmp_suffix, 'w') as f:
+                f.write(hashlib.sha256(content).hexdigest())
+            with open(generation_path + tmp_suffix, 'w') as f:
+                f.write(generation or '')
+            os.replace(model_path + tmp_suffix, model_path)
+            os.replace(checksum_path + tmp_suffix, checksum_path)
+            os.replace(generation_path + tmp_suffix, generation_path)
+        except OSError as e:
+            print(f"Could not write model cache for {model_name}: {e}")
+
+    def fetch_content(self, model_name: str, use_disk_cache: bool = True):
+        """
+        Return (model bytes, source, generation), reading the disk cache before the model source.
+
+        The cache is only used while it holds the source's current generation,
+        checked with a metadata-only lookup, so a restart always picks up a
+        retrained model even with the reload watcher off. If the source cannot
+        be reached the cached copy is served anyway.
+        """
+        if use_disk_cache:
+            cached = self._read_disk_cache(model_name)
+            if cached is not None:
+                try:
+                    current = self.source.generation(model_name)
+                except Exception as e:
+                    print(f"Could not check the generation of {model_name}, using the cached copy: {e}")
+                    return cached[0], 'disk', cached[1]
+                if cached[1] == current:
+                    return cached[0], 'disk', cached[1]
+                with self._lock:
+                    self._stats['stale_disk_cache'] += 1
+                print(f"Cached model {model_name} is generation {cached[1]}, source has {current}; downloading again")
+        content, generation = self.source.fetch(model_name)
+        self._write_disk_cache(model_name, content, generation)
+        return content, self.source.name, generation
+
+    def _load(self, model_name: str, use_disk_cache: bool = True) -> LoadedModel:
+        start = time.perf_counter()
+        content, source, generation = self.fetch_content(model_name, use_disk_cache=use_disk_cache)
+
+        tuned = self.profile.get(model_name, {})
+        num_threads = self.num_threads if self.num_threads is not None else tuned.get('num_threads')
+        pool = InterpreterPool(content, size=self.pool_size, num_threads=num_threads,
+                               delegate=tuned.get('delegate', 'xnnpack'))
+        load_seconds = time.perf_counter() - start
+        with self._lock:
+            self._stats['disk_loads' if source == 'disk' else 'downloads'] += 1
+        return LoadedModel(model_name, content, pool, source, load_seconds, generation=generation)
+
+    def get(self, model_name: str) -> LoadedModel:
+        """Return the loaded model, fetching it on first use."""
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is not None:
+                self._stats['hits'] += 1
+                return model
+            self._stats['misses'] += 1
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        # Only one thread loads a given model; the others wait and reuse its result
+        with load_lock:
+            model = self._models.get(model_name)
+            if model is not None:
+                return model
+            try:
+                model = self._load(model_name)
+            except Exception as e:
+                with self._lock:
+                    self._stats['load_errors'] += 1
+                print(f"Error loading model {model_name}: {e}")
+                raise e
+            with self._lock:
+                self._models[model_name] = model
+            return model
+
+    def input_spec(self, model_name: str) -> InputSpec:
+        """Return the input dtype/quantization of the model served for `model_name`."""
+        return self.get(model_name).input_spec
+
+    def model_version(self, model_name: str) -> str:
+        """Return the version string of the model currently served for `model_name`."""
+        return self.get(model_name).version
+
+    def run_inference(self, model_name: str, input_data: np.ndarray, timeout: Optional[float] = None) -> np.ndarray:
+        """Run `run_tflite_inference` on an interpreter checked out from the model's pool."""
+        return self.get(model_name).run_inference(input_data, timeout=timeout)
+
+    def run_batch_inference(self, model_name: str, input_data: np.ndarray, batch_size: Optional[int] = None,
+                            timeout: Optional[float] = None) -> np.ndarray:
+        """Like `run_inference`, but for a stacked batch; returns one output row per input."""
+        return self.get(model_name).run_batch_inference(input_data, batch_size=batch_size, timeout=timeout)
+
+    def check_for_updates(self):
+        """Reload every loaded model whose source generation changed, returning their names."""
+        with self._lock:
+            models = list(self._models.values())
+        reloaded = []
+        for model in models:
+            try:
+                generation = self.source.generation(model.name)
+                with self._lock:
+                    self._stats['update_checks'] += 1
+                if generation == model.generation:
+                    continue
+                # Build the new pool before taking the lock; requests keep using the old one meanwhile
+                new_model = self._load(model.name, use_disk_cache=False)
+                with self._lock:
+                    self._models[model.name] = new_model
+                    self._stats['reloads'] += 1
+                print(f"Reloaded model {model.name}: {model.version} -> {new_model.version}")
+                reloaded.append(model.name)
+            except Exception as e:
+                with self._lock:
+                    self._stats['reload_errors'] += 1
+                print(f"Error checking model {model.name} for updates: {e}")
+        return reloaded
+
+    def start_reload_watcher(self, interval_seconds: float):
+        """Start a daemon thread that calls `check_for_updates` every `interval_seconds`."""
+        if self._watcher is not None or interval_seconds <= 0:
+            return
+
+        def watch():
+            while not self._stop_watcher.wait(interval_seconds):
+                self.check_for_updates()
+
+        self._watcher = threading.Thread(target=watch, name='model-reload-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_reload_watcher(self):
+        self._stop_watcher.set()
+
+    def warm(self, model_names: Iterable[str]):
+        """Load the given models ahead of the first request. Failures are logged, not raised."""
+        for model_name in model_names:
+            try:
+                self.get(model_name)
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            models = list(self._models.values())
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['backend'] = _backend.name if _backend is not None else None
+        stats['models'] = {
+            model.name: {
+                'source': model.source,
+                'load_seconds': round(model.load_seconds, 4),
+                'size_bytes': model.size,
+                'version': model.version,
+                'loaded_at': model.loaded_at,
+                'input': model.input_spec.describe(),
+                'pool': model.pool.stats(),
+                'batch_pools': {str(size): pool.stats() for size, pool in list(model.batch_pools.items())},
+            }
+            for model in models
+        }
+        return stats
+
+
+_registries: Dict[str, TFLiteModelRegistry] = {}
+_registries_lock = threading.Lock()
+
+def get_model_registry(bucket_name: str, cache_dir: Optional[str] = './model_cache',
+                       pool_size: int = 1, num_threads: Optional[int] = None,
+                       profile_path: Optional[str] = None, model_dir: Optional[str] = None) -> TFLiteModelRegistry:
+    """
+    Return the process-wide registry for a bucket, creating it on first use.
+
+    When `model_dir` is given, models are read from that directory instead of GCS.
+    """
+    with _registries_lock:
+        registry = _registries.get(bucket_name)
+        if registry is None:
+            source = LocalModelSource(model_dir) if model_dir else None
+            registry = TFLiteModelRegistry(bucket_name, cache_dir=cache_dir, pool_size=pool_size,
+                                           num_threads=num_threads, profile_path=profile_path, source=source)
+            _registries[bucket_name] = registry
+        return registry